@@ -7,23 +7,22 @@ and AirQualityController classes, and running the controller.
 Usage:
     - Run this script to start the Air Quality Analysis Tool.
 
-Note: - Make sure to have the required CSV files ('pm25_data.csv', 'temperature_data.csv', 'humidity_data.csv') in
-the same directory as this script.
+Note: - The datasets the tool can open are listed in 'datasets.csv'. Each dataset directory needs the CSV files
+('pm25_data.csv', 'temperature_data.csv', 'humidity_data.csv', 'stations.csv'); the first dataset is opened at start
+and the others are loaded when they are selected.
+      - If a dataset directory has a reading store ('readings.aqstore', built with `python pm_storage.py`), it is
+memory-mapped instead of parsing the CSV files.
 
 """
-from pm_model import AirQualityModel
+from pm_datasets import DatasetCatalog
 from pm_view import AirQualityView
 from pm_controller import AirQualityController
-import pandas as pd
 
 if __name__ == "__main__":
 
-    pm25_data = pd.read_csv("pm25_data.csv")
-    temperature_data = pd.read_csv("temperature_data.csv")
-    humidity_data = pd.read_csv("humidity_data.csv")
-
-    model = AirQualityModel(pm25_data, temperature_data, humidity_data)
+    catalog = DatasetCatalog.load()
+    model = catalog.model(catalog.default)
     view = AirQualityView()
-    controller = AirQualityController(model, view)
+    controller = AirQualityController(model, view, catalog)
     view.set_controller(controller)
     controller.run()
@@ -0,0 +1,138 @@
+"""
+Module: pm_anomaly
+
+This module contains the AnomalyDetector class, which flags suspicious PM2.5 readings across all stations at once.
+A reading is flagged when it is far from its own station's recent history (rolling median and MAD) or from its nearest
+neighbouring stations at the same hour. Both scores are robust z-scores, so a few bad readings do not hide others.
+"""
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+DEFAULT_WINDOW = 24
+DEFAULT_THRESHOLD = 3.5
+DEFAULT_NEIGHBOURS = 3
+# Smallest spread used in a robust z-score, so flat series do not flag every small change
+MIN_MAD = 1.0
+MAD_SCALE = 0.6745
+ANOMALY_COLUMNS = ['time', 'station', 'value', 'temporal_score', 'spatial_score']
+
+
+def robust_z(values, center, mad):
+    """
+    Calculate robust z-scores from a median and a median absolute deviation.
+    """
+    return MAD_SCALE * (values - center) / np.maximum(mad, MIN_MAD)
+
+
+class AnomalyDetector:
+    def __init__(self, registry, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD, neighbours=DEFAULT_NEIGHBOURS):
+        """
+        Initialize the AnomalyDetector object.
+
+        Parameters:
+        - registry: StationRegistry used to find each station's neighbours
+        - window: Number of earlier hours each reading is compared with
+        - threshold: Robust z-score above which a reading is flagged
+        - neighbours: Number of nearest stations each reading is compared with
+        """
+        self.registry = registry
+        self.window = window
+        self.threshold = threshold
+        self.neighbours = neighbours
+
+    def temporal_scores(self, values):
+        """
+        Score each reading against the median and MAD of the same station's previous `window` hours.
+
+        Parameters:
+        - values: A (hours x stations) array of readings
+
+        Returns:
+        - A (hours x stations) array of robust z-scores, NaN for the first `window` hours
+        """
+        scores = np.full(values.shape, np.nan)
+        if len(values) <= self.window:
+            return scores
+        # Window i covers hours i .. i + window - 1 and scores hour i + window
+        windows = sliding_window_view(values, self.window, axis=0)[:-1]
+        # Stations without readings in a window give NaN scores; numpy warns about those through warnings, not errstate
+        with warnings.catch_warnings(), np.errstate(invalid="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            center = np.nanmedian(windows, axis=2)
+            mad = np.nanmedian(np.abs(windows - center[:, :, None]), axis=2)
+        scores[self.window:] = robust_z(values[self.window:], center, mad)
+        return scores
+
+    def spatial_scores(self, values, stations):
+        """
+        Score each reading by how much it differs from its nearest stations, relative to how much every station
+        differs from its neighbours in the same hour.
+
+        Parameters:
+        - values: A (hours x stations) array of readings
+        - stations: Station names of the columns
+
+        Returns:
+        - A (hours x stations) array of robust z-scores
+        """
+        if len(stations) < 2:
+            return np.full(values.shape, np.nan)
+        nearest, _ = self.registry.nearest_neighbours(stations, self.neighbours)
+        with warnings.catch_warnings(), np.errstate(invalid="ignore"):
+            warnings.simplefilter("ignore", RuntimeWarning)
+            deviation = values - np.nanmedian(values[:, nearest], axis=2)
+            center = np.nanmedian(deviation, axis=1, keepdims=True)
+            mad = np.nanmedian(np.abs(deviation - center), axis=1, keepdims=True)
+        return robust_z(deviation, center, mad)
+
+    def detect(self, values, times, stations, start_row=0):
+        """
+        Flag anomalous readings.
+
+        Parameters:
+        - values: A (hours x stations) array of readings, NaN where missing
+        - times: Timestamps of the rows
+        - stations: Station names of the columns
+        - start_row: Only rows from this one on are reported; earlier rows are history for the rolling window
+
+        Returns:
+        - DataFrame with one row per flagged (time, station) and columns ANOMALY_COLUMNS
+        """
+        temporal = self.temporal_scores(values)[start_row:]
+        spatial = self.spatial_scores(values[start_row:], stations)
+        with np.errstate(invalid="ignore"):
+            flagged = (np.abs(temporal) > self.threshold) | (np.abs(spatial) > self.threshold)
+        rows, columns = np.nonzero(flagged)
+        return pd.DataFrame({
+            'time': pd.DatetimeIndex(times)[start_row:][rows],
+            'station': np.asarray(stations, dtype=object)[columns],
+            'value': values[start_row:][rows, columns],
+            'temporal_score': temporal[rows, columns],
+            'spatial_score': spatial[rows, columns],
+        }, columns=ANOMALY_COLUMNS)
+
+
+def anomaly_report(anomalies):
+    """
+    Describe flagged readings as text, one line per (time, station).
+
+    Parameters:
+    - anomalies: DataFrame returned by AnomalyDetector.detect
+    """
+    if anomalies.empty:
+        return "No anomalies found."
+    lines = [f"{len(anomalies)} anomalous readings:"]
+    for row in anomalies.itertuples(index=False):
+        lines.append(f"{row.time:%m/%d/%Y %H:%M}  {row.station:>8}  {row.value:7.1f}  "
+                     f"temporal z = {row.temporal_score:6.1f}  spatial z = {row.spatial_score:6.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from pm_model import AirQualityModel
+
+    model = AirQualityModel(None, None, None)
+    model.load_data()
+    print(anomaly_report(model.anomalies))
@@ -0,0 +1,72 @@
+"""
+Module: pm_cache
+
+This module contains the LRUCache class, a size-bounded least-recently-used cache with hit and miss counters used by
+the air quality analysis tool to keep recent query results.
+"""
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize=128):
+        """
+        Initialize the LRUCache object.
+
+        Parameters:
+        - maxsize: The maximum number of entries kept before the least recently used one is evicted
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """
+        Get a cached value and mark it as most recently used.
+
+        Parameters:
+        - key: The cache key
+        - default: The value returned on a miss
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the least recently used entry if the cache is full.
+
+        Parameters:
+        - key: The cache key
+        - value: The value to store
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove every entry, keeping the hit and miss counters.
+        """
+        self.entries.clear()
+
+    def stats(self):
+        """
+        Get the cache statistics.
+
+        Returns:
+        - Dictionary with hits, misses, hit rate, current size and maximum size
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries), "maxsize": self.maxsize}
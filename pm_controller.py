@@ -4,24 +4,41 @@ Module: pm_controller
 This module contains the AirQualityController class, which controls the interaction between the Air Quality Model and
 the Air Quality View.
 """
-from datetime import datetime
-from tkinter import messagebox
+from datetime import datetime, timedelta
+from tkinter import filedialog, messagebox
+import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
+from pm_anomaly import anomaly_report
+from pm_export import export_data
+from pm_live import LiveFeed
+
+LIVE_POLL_MS = 5000
+PLAYBACK_DAYS = 7
+PLAYBACK_FRAME_MS = 150
+VARIABLE_KEYS = {"PM2.5": "pm25", "Temperature": "temperature", "Humidity": "humidity"}
 
 
 class AirQualityController:
-    def __init__(self, model, view):
+    def __init__(self, model, view, catalog=None):
         """
         Initialize the AirQualityController object.
 
         Parameters:
         - model: The model object
         - view: The view object
+        - catalog: DatasetCatalog to switch datasets from, with the model being its default dataset
         """
         self.pm25_value = None
         self.model = model
         self.view = view
+        self.catalog = catalog
+        self.dataset = None if catalog is None else catalog.default
+        self.live_feed = None
+        self.live_job = None
+        self.live_chart = None
+        self.playback = None
+        self.playback_job = None
 
     @property
     def get_pm25_data(self):
@@ -30,11 +47,21 @@ class AirQualityController:
         """
         return self.pm25_value
 
+    @property
+    def query_cache_stats(self):
+        """
+        Get the hit and miss statistics of the model's query cache.
+        """
+        return self.model.query_cache.stats()
+
     def load_data_button_clicked(self):
         """
         Load data when the Load Data button is clicked.
         """
-        date, station = self.model.load_data()
+        # Models from the dataset catalog are loaded already, so switching back to one does not parse it again
+        if self.model.dates_times is None:
+            self.model.load_data()
+        date, station = self.model.dates_times, self.model.stations
         self.view.station_combobox.configure(values=station)
         self.view.station_combobox.configure(state="readonly")
         times = date.dt.strftime("%H:%M").unique()
@@ -45,55 +72,47 @@ class AirQualityController:
         """
         Display statistics for PM2.5, temperature, and humidity.
 
-        This function calculates and displays statistics such as mean, median, minimum, and maximum
-        values for PM2.5, temperature, and humidity data.
+        This function shows statistics such as mean, median, minimum, and maximum values of PM2.5, temperature,
+        and humidity at every station in a table that can be sorted and filtered.
 
         """
         if not self.model:
             messagebox.showerror("Error", "You need to load data first.")
             return
 
-        pm25_data = self.model.pm25_data
-        temperature_data = self.model.temperature_data
-        humidity_data = self.model.humidity_data
-
-        if pm25_data is None or temperature_data is None or humidity_data is None:
+        if any(frame is None for frame in self.model.frames().values()):
             messagebox.showerror("Error", "One or more data tables are missing.")
             return
 
-        # Calculate statistics for PM2.5
-        pm25_statistics = pm25_data.describe().round(2)
-        pm25_statistics_text = "PM2.5 Statistics:\n" + pm25_statistics.to_string() + "\n\n"
+        # Statistics are computed once until the data changes; the table only formats the rows on screen
+        labels, columns, values = self.model.station_statistics()
+        self.view.show_statistics_table(labels, columns, values)
 
-        # Calculate statistics for temperature
-        temperature_statistics = temperature_data.describe().round(2)
-        temperature_statistics_text = "Temperature Statistics:\n" + temperature_statistics.to_string() + "\n\n"
-
-        # Calculate statistics for humidity
-        humidity_statistics = humidity_data.describe().round(2)
-        humidity_statistics_text = "Humidity Statistics:\n" + humidity_statistics.to_string()
-
-        # Prepare statistics text
-        statistics_text = pm25_statistics_text + temperature_statistics_text + humidity_statistics_text
-
-        # Display statistics
-        messagebox.showinfo("Statistics", statistics_text)
+    def display_anomalies(self):
+        """
+        Display the PM2.5 readings flagged as anomalous, for the selected station or for every station.
+        """
+        anomalies = self.model.anomalies
+        selected_station = self.view.station_combobox.get()
+        if selected_station:
+            anomalies = anomalies[anomalies['station'] == selected_station]
+            title = f"Anomalies at {selected_station}"
+        else:
+            title = "Anomalies at all stations"
+        self.view.show_report(title, anomaly_report(anomalies))
 
     def display_pie_chart(self):
         """
         Display a pie chart of PM2.5 categories distribution.
         """
         if self.model:
-            pm25_data = self.model.pm25_data
             selected_station = self.view.station_combobox.get()
             if selected_station:
-                if pm25_data is not None:
-                    pm25_categories = pd.cut(pm25_data[selected_station],
-                                             bins=[0, 12, 35.5, 43, 54, 75, 91],
-                                             labels=['Good', 'Moderate', 'Unhealthy for Sensitive Groups', 'Unhealthy',
-                                                     'Very Unhealthy', 'Hazardous'])
+                if self.model.pm25_category_counts is not None:
+                    # The category counts are kept up to date on load and on every live append
+                    counts = self.model.pm25_category_distribution(selected_station)
                     plt.figure(figsize=(8, 6))
-                    pm25_categories.value_counts().plot.pie(autopct='%1.1f%%', startangle=140)
+                    counts.sort_values(ascending=False, kind="stable").plot.pie(autopct='%1.1f%%', startangle=140)
                     plt.title(f'PM2.5 Categories Distribution of {selected_station}')
                     plt.ylabel('')
                     plt.tight_layout()
@@ -116,7 +135,7 @@ class AirQualityController:
             if selected_station:
                 if pm25_data is not None:
                     plt.figure(figsize=(8, 6))
-                    plt.hist(pm25_data[selected_station], bins=20, color='skyblue', edgecolor='black', alpha=0.7)
+                    plt.hist(pm25_data[selected_station].dropna(), bins=20, color='skyblue', edgecolor='black', alpha=0.7)
                     plt.title(f'PM2.5 Concentration Distribution of {selected_station}')
                     plt.xlabel('PM2.5 Concentration')
                     plt.ylabel('Frequency')
@@ -136,10 +155,6 @@ class AirQualityController:
         Handle the click event of the Display Graph button.
         """
         if self.model:
-            pm25_data = self.model.pm25_data
-            temperature_data = self.model.temperature_data
-            humidity_data = self.model.humidity_data
-
             selected_station = self.view.station_combobox.get()
             if selected_station:
 
@@ -160,14 +175,11 @@ class AirQualityController:
                         end_datetime = datetime.combine(end_date, end_time_obj)
 
                         # Filter data based on selected date and time range
-                        pm25_data_filtered = pm25_data[(pm25_data['date'] + ' ' + pm25_data['time']).apply(
-                            lambda x: start_datetime <= datetime.strptime(x, '%m/%d/%Y %H:%M') <= end_datetime)]
-                        temperature_data_filtered = temperature_data[
-                            (temperature_data['date'] + ' ' + temperature_data['time']).apply(
-                                lambda x: start_datetime <= datetime.strptime(x, '%m/%d/%Y %H:%M') <= end_datetime)]
-                        humidity_data_filtered = humidity_data[
-                            (humidity_data['date'] + ' ' + humidity_data['time']).apply(
-                                lambda x: start_datetime <= datetime.strptime(x, '%m/%d/%Y %H:%M') <= end_datetime)]
+                        filtered = self.model.query([selected_station], VARIABLE_KEYS.values(),
+                                                    start_datetime, end_datetime)
+                        pm25_data_filtered = filtered["pm25"]
+                        temperature_data_filtered = filtered["temperature"]
+                        humidity_data_filtered = filtered["humidity"]
                         checkboxes_selected = {
                             "PM2.5": self.view.pm25_checkbox.get(),
                             "Temperature": self.view.temperature_checkbox.get(),
@@ -198,6 +210,43 @@ class AirQualityController:
         else:
             messagebox.showerror("Error", "You need to load data first")
 
+    def export_button_clicked(self):
+        """
+        Export the selected station, variables and date range to a CSV, Parquet or Arrow file.
+
+        Every station is exported if none is selected, and every variable if no checkbox is ticked.
+        """
+        start_date = self.view.get_start_date()
+        end_date = self.view.get_end_date()
+        start_time = self.view.get_start_time()
+        end_time = self.view.get_end_time()
+        if not (start_date and end_date and start_time and end_time):
+            messagebox.showerror("Error", "Please fill all the date and time fields")
+            return
+        start_datetime = datetime.combine(start_date, datetime.strptime(start_time, '%H:%M').time())
+        end_datetime = datetime.combine(end_date, datetime.strptime(end_time, '%H:%M').time())
+
+        selected_station = self.view.station_combobox.get()
+        checkboxes_selected = {
+            "PM2.5": self.view.pm25_checkbox.get(),
+            "Temperature": self.view.temperature_checkbox.get(),
+            "Humidity": self.view.humidity_checkbox.get()
+        }
+        variables = [VARIABLE_KEYS[var] for var, selected in checkboxes_selected.items() if selected]
+        path = filedialog.asksaveasfilename(defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"), ("Parquet", "*.parquet"),
+                                                       ("Arrow IPC", "*.arrow")])
+        if not path:
+            return
+        try:
+            count = export_data(self.model, path, stations=[selected_station] if selected_station else None,
+                                variables=variables or list(VARIABLE_KEYS.values()),
+                                start=start_datetime, end=end_datetime)
+        except (ImportError, ValueError, OSError) as error:
+            messagebox.showerror("Error", str(error))
+            return
+        messagebox.showinfo("Export", f"Exported {count} rows to {path}")
+
     def display_line_graph(self, pm25_data, temperature_data, humidity_data, selected_station, var):
         """
         Plot the graph based on selected data type (PM2.5, Temperature, Humidity)
@@ -214,6 +263,14 @@ class AirQualityController:
             ax.plot(pm25_data['date'] + ' ' + pm25_data['time'],
                     pm25_data[selected_station], label='PM2.5')
             ax.set_ylabel('Micrograms/Cubic meter of air')
+            # Mark the readings the model flagged as anomalous
+            anomalies = self.model.anomalies
+            flagged_times = anomalies.loc[anomalies['station'] == selected_station, 'time']
+            flagged = pd.to_datetime(pm25_data['date'] + ' ' + pm25_data['time']).isin(flagged_times)
+            if flagged.any():
+                ax.scatter(pm25_data.loc[flagged, 'date'] + ' ' + pm25_data.loc[flagged, 'time'],
+                           pm25_data.loc[flagged, selected_station], color='red', marker='x', zorder=3,
+                           label='Anomaly')
         elif var == 'Temperature':
             ax.plot(temperature_data['date'] + ' ' + temperature_data['time'],
                     temperature_data[selected_station], label='Temperature')
@@ -228,7 +285,8 @@ class AirQualityController:
         ax.tick_params(axis='x', rotation=30)
         ax.legend()
         ax.grid(True)
-        self.view.display_graph1(fig)
+        canvas = self.view.display_graph1(fig)
+        self.track_live_chart(canvas, ax, var, selected_station)
 
     def display_correlation(self, pm25_data, temperature_data, humidity_data, selected_station, var1, var2):
         """
@@ -274,19 +332,114 @@ class AirQualityController:
         - nearest_station: The nearest station
 
         Returns:
-        - PM2.5 value
+        - PM2.5 value, or None if there is no reading for that hour
         """
         time_obj = datetime.strptime(time, "%H:%M").time()
         start_datetime = datetime.combine(date, time_obj)
 
-        pm25_data_filtered = self.model.pm25_data[
-            (self.model.pm25_data['date'] + ' ' + self.model.pm25_data['time']).apply(
-                lambda x: start_datetime <= datetime.strptime(x, '%m/%d/%Y %H:%M') <= start_datetime)]
+        pm25_data_filtered = self.model.query([nearest_station], ["pm25"], start_datetime, start_datetime)["pm25"]
         print(nearest_station)
 
+        if pm25_data_filtered.empty or pd.isna(pm25_data_filtered.iloc[0][nearest_station]):
+            return None
         pm25_value = pm25_data_filtered.iloc[0][nearest_station]
         return pm25_value
 
+    def update_forecast_tiles(self):
+        """
+        Show the PM2.5 forecast for the next hours at the nearest station on the home page tiles.
+        """
+        if not self.view.pm_tiles:
+            return
+        forecast = self.model.forecast(len(self.view.pm_tiles))
+        if forecast is None or self.view.nearest_station not in forecast[1]:
+            return
+        timestamps, stations, values = forecast
+        station_values = values[:, stations.index(self.view.nearest_station)]
+        # Tiles use the model's PM2.5 bins, like the markers and the heatmap
+        categories = self.model.categorize(station_values, clip=True)
+        self.view.update_pm_tiles([(timestamp.strftime("%H:%M"), None if np.isnan(value) else f"{value:.0f}", category)
+                                   for timestamp, value, category in zip(timestamps, station_values, categories)])
+
+    def update_heatmap(self, prefetch=False):
+        """
+        Draw the PM2.5 heatmap for the date and time chosen on the home page, or clear it if it is turned off.
+
+        Parameters:
+        - prefetch: True to interpolate every hour of the chosen date in one batch, so scrubbing the time is cached
+        """
+        if not self.view.heatmap_enabled():
+            self.view.clear_heatmap()
+            return
+        date = self.view.get_choose_date()
+        time_obj = datetime.strptime(self.view.get_choose_time(), "%H:%M").time()
+        if prefetch:
+            self.model.pm25_surfaces(pd.date_range(datetime.combine(date, datetime.min.time()), periods=24, freq="h"))
+        surface = self.model.pm25_surfaces([datetime.combine(date, time_obj)])[0]
+        if surface is None:
+            self.view.clear_heatmap()
+            return
+        self.view.draw_heatmap(self.model.spatial_grid().cells(),
+                               self.model.categorize(surface.ravel(), clip=True))
+
+    def toggle_playback(self):
+        """
+        Start or stop animating the station markers from the chosen date and time.
+        """
+        if self.playback_job is not None:
+            self.stop_playback()
+        else:
+            self.start_playback()
+
+    def start_playback(self):
+        """
+        Prefetch a week of hourly station readings from the chosen date and time, then start the animation.
+        """
+        time_obj = datetime.strptime(self.view.get_choose_time(), "%H:%M").time()
+        start = datetime.combine(self.view.get_choose_date(), time_obj)
+        times, stations, values, categories = self.model.station_frames(start, start + timedelta(days=PLAYBACK_DAYS))
+        if not len(times):
+            messagebox.showerror("Error", "No PM2.5 data available for the selected date and time")
+            return
+        texts = np.where(np.isnan(values), "-", np.char.mod("%.0f", values))
+        texts = np.char.add(np.char.add(np.asarray(stations, dtype=str), " "), texts)
+        if self.view.heatmap_enabled():
+            self.model.pm25_surfaces(times)
+        indices = self.model.registry.indices(stations)
+        self.view.show_station_markers(stations, self.model.registry.latitudes[indices],
+                                       self.model.registry.longitudes[indices])
+        self.playback = {"times": times, "categories": categories, "texts": texts, "frame": 0}
+        self.playback_step()
+
+    def playback_step(self):
+        """
+        Show the next playback frame and schedule the one after it.
+        """
+        playback = self.playback
+        frame = playback["frame"]
+        if frame >= len(playback["times"]):
+            self.stop_playback()
+            return
+        timestamp = playback["times"][frame]
+        self.view.update_station_markers(playback["categories"][frame], playback["texts"][frame])
+        if self.view.heatmap_enabled():
+            surface = self.model.pm25_surfaces([timestamp])[0]
+            if surface is not None:
+                self.view.draw_heatmap(self.model.spatial_grid().cells(),
+                                       self.model.categorize(surface.ravel(), clip=True))
+        self.view.set_playback_state(True, timestamp.strftime("%m/%d/%Y %H:%M"))
+        playback["frame"] = frame + 1
+        self.playback_job = self.view.root.after(PLAYBACK_FRAME_MS, self.playback_step)
+
+    def stop_playback(self):
+        """
+        Stop the marker animation, leaving the markers at the last frame shown.
+        """
+        if self.playback_job is not None:
+            self.view.root.after_cancel(self.playback_job)
+            self.playback_job = None
+            self.view.set_playback_state(False)
+
     def find_nearest_station(self, latitude, longitude):
         """
         Find the nearest station to a given latitude and longitude.
@@ -329,8 +482,133 @@ class AirQualityController:
         if start_date == end_date and start_time == end_time:
             messagebox.showerror("Error", "End time must be different from start time")
 
+    def track_live_chart(self, canvas, ax, var, selected_station):
+        """
+        Remember the line graph just drawn so live updates can extend it.
+
+        Parameters:
+        - canvas: The canvas the graph is drawn on
+        - ax: The axes of the graph
+        - var: The variable displayed (PM2.5, Temperature, or Humidity)
+        - selected_station: The station displayed
+        """
+        line = ax.get_lines()[-1]
+        x_data, y_data = line.get_data()
+        if len(x_data) == 0:
+            self.live_chart = None
+            return
+        self.live_chart = {"canvas": canvas, "ax": ax, "variable": VARIABLE_KEYS[var], "station": selected_station,
+                           "color": line.get_color(), "last_x": x_data[-1], "last_y": y_data[-1]}
+
+    def toggle_live(self, enabled):
+        """
+        Start or stop following the CSV files for new rows.
+
+        Parameters:
+        - enabled: True to start live mode, False to stop it
+        """
+        if enabled:
+            self.start_live()
+        else:
+            self.stop_live()
+
+    def start_live(self):
+        """
+        Start polling the CSV files for newly appended rows.
+        """
+        if self.live_job is not None:
+            return
+        if self.live_feed is None:
+            # Aligned tables can have more or fewer rows than their files, so skip the rows actually read from each file
+            skip_rows = {variable: self.model.file_rows.get(variable, len(frame))
+                         for variable, frame in self.model.frames().items()}
+            self.live_feed = LiveFeed(self.model.data_files, skip_rows)
+        self.live_job = self.view.root.after(LIVE_POLL_MS, self.poll_live)
+
+    def stop_live(self):
+        """
+        Stop polling the CSV files.
+        """
+        if self.live_job is not None:
+            self.view.root.after_cancel(self.live_job)
+            self.live_job = None
+
+    def poll_live(self):
+        """
+        Append any new rows to the model and push them to the open views, then schedule the next poll.
+        """
+        new_rows = self.live_feed.poll()
+        if any(len(rows) for rows in new_rows.values()):
+            new_rows = self.model.append_rows(new_rows)
+            self.view.set_date_bounds(*self.model.date_bounds())
+            self.push_live_rows(new_rows)
+        self.live_job = self.view.root.after(LIVE_POLL_MS, self.poll_live)
+
+    def push_live_rows(self, new_rows):
+        """
+        Refresh the home page forecast tiles and extend the open line graph with newly appended rows only.
+
+        Parameters:
+        - new_rows: Dictionary mapping variable name to a DataFrame of new rows
+        """
+        if "pm25" in new_rows:
+            self.update_forecast_tiles()
+
+        chart = self.live_chart
+        if chart is None or not chart["canvas"].get_tk_widget().winfo_exists():
+            self.live_chart = None
+            return
+        rows = new_rows.get(chart["variable"])
+        if rows is None:
+            return
+        x_data = list(rows['date'] + ' ' + rows['time'])
+        y_data = list(rows[chart["station"]])
+        # Join the new segment to the last point already drawn
+        chart["ax"].plot([chart["last_x"]] + x_data, [chart["last_y"]] + y_data, color=chart["color"])
+        chart["last_x"], chart["last_y"] = x_data[-1], y_data[-1]
+        chart["canvas"].draw_idle()
+
+    def select_dataset(self, name):
+        """
+        Switch to another dataset of the catalog, loading it only if it is not one of the recently used datasets.
+
+        Parameters:
+        - name: The dataset name
+        """
+        if name == self.dataset:
+            return
+        try:
+            model = self.catalog.model(name)
+        except FileNotFoundError as error:
+            messagebox.showerror("Error", str(error))
+            self.view.dataset_combobox.set(self.dataset)
+            return
+        self.stop_playback()
+        self.stop_live()
+        self.view.live_switch.deselect()
+        self.live_feed = None
+        self.live_chart = None
+        self.model = model
+        self.dataset = name
+        self.show_dataset()
+        self.view.swap_page(self.view.home_page)
+
+    def show_dataset(self):
+        """
+        Point the view at the current dataset: its name, map position, date range and the station the home page
+        tiles follow, which starts as the station nearest the map position.
+        """
+        if self.catalog is not None:
+            dataset = self.catalog.datasets[self.dataset]
+            self.view.set_datasets(self.catalog.names, self.dataset)
+            self.view.set_map_position(dataset.latitude, dataset.longitude)
+            self.view.nearest_station = self.model.nearest_station(dataset.latitude, dataset.longitude)[0]
+        self.view.set_date_bounds(*self.model.date_bounds())
+
     def run(self):
         """
         Run the application.
         """
+        self.show_dataset()
+        self.update_forecast_tiles()
         self.view.run()
@@ -0,0 +1,127 @@
+"""
+Module: pm_datasets
+
+This module contains the DatasetCatalog class, which lists the air quality datasets (one per city) the tool can open.
+Each dataset is a directory with the three CSV files, its station file and optionally a reading store. A dataset is
+only loaded when it is selected, and the most recently used ones are kept loaded so switching back to them does not
+parse the files again.
+"""
+import os
+import pandas as pd
+from pm_cache import LRUCache
+from pm_model import AirQualityModel, DATA_FILES
+from pm_stations import StationRegistry, STATIONS_FILE
+
+CATALOG_FILE = "datasets.csv"
+STORE_FILE = "readings.aqstore"
+LOADED_DATASETS = 3
+
+
+class Dataset:
+    def __init__(self, name, directory, latitude, longitude):
+        """
+        Initialize the Dataset object.
+
+        Parameters:
+        - name: The name shown in the dataset selector, e.g. the city
+        - directory: The directory with the dataset's files
+        - latitude: Latitude the map is centred on
+        - longitude: Longitude the map is centred on
+        """
+        self.name = name
+        self.directory = directory
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @property
+    def data_files(self):
+        """
+        Get the CSV file of each variable, keyed by variable name.
+        """
+        return {variable: os.path.join(self.directory, file) for variable, file in DATA_FILES.items()}
+
+    @property
+    def stations_file(self):
+        return os.path.join(self.directory, STATIONS_FILE)
+
+    @property
+    def store_file(self):
+        return os.path.join(self.directory, STORE_FILE)
+
+    def load(self):
+        """
+        Load the dataset into a new model, from the reading store if there is one and from the CSV files otherwise.
+
+        Raises:
+        - FileNotFoundError: If the station file or the data files are missing
+        """
+        registry = StationRegistry.load(self.stations_file)
+        if os.path.exists(self.store_file):
+            model = AirQualityModel.from_store(self.store_file, registry=registry, data_files=self.data_files)
+        else:
+            model = AirQualityModel(None, None, None, registry=registry, data_files=self.data_files)
+        if model.load_data() is None:
+            raise FileNotFoundError(f"The data files of {self.name} were not found in {self.directory}")
+        return model
+
+
+class DatasetCatalog:
+    def __init__(self, datasets, max_loaded=LOADED_DATASETS):
+        """
+        Initialize the DatasetCatalog object.
+
+        Parameters:
+        - datasets: List of Dataset objects, the first one is opened at start
+        - max_loaded: Number of loaded datasets kept in memory
+        """
+        self.datasets = {dataset.name: dataset for dataset in datasets}
+        if not self.datasets:
+            raise ValueError("The dataset catalog is empty")
+        if len(self.datasets) != len(datasets):
+            raise ValueError("Dataset names in the catalog must be unique")
+        self.loaded = LRUCache(max_loaded)
+
+    @classmethod
+    def load(cls, path=CATALOG_FILE, max_loaded=LOADED_DATASETS):
+        """
+        Load the catalog from a file with 'name', 'directory', 'latitude' and 'longitude' columns.
+
+        Directories are relative to the catalog file.
+
+        Parameters:
+        - path: The catalog file
+        - max_loaded: Number of loaded datasets kept in memory
+        """
+        entries = pd.read_csv(path, dtype={"name": str, "directory": str})
+        base = os.path.dirname(path)
+        return cls([Dataset(row.name, os.path.join(base, row.directory), row.latitude, row.longitude)
+                    for row in entries.itertuples(index=False)], max_loaded)
+
+    @property
+    def names(self):
+        return list(self.datasets)
+
+    @property
+    def default(self):
+        """
+        Get the name of the dataset opened at start.
+        """
+        return self.names[0]
+
+    def model(self, name):
+        """
+        Get the model of a dataset, loading it if it is not one of the recently used datasets.
+
+        Parameters:
+        - name: The dataset name
+
+        Raises:
+        - KeyError: If the dataset is not in the catalog
+        - FileNotFoundError: If the dataset's files are missing
+        """
+        dataset = self.datasets[name]
+        model = self.loaded.get(name)
+        if model is None:
+            model = dataset.load()
+            self.loaded.put(name, model)
+        return model
@@ -0,0 +1,202 @@
+"""
+Module: pm_export
+
+This module exports a selection of the air quality data (stations, variables and a date range, raw or aggregated) to
+CSV, Parquet or Arrow IPC files for downstream systems. Rows are produced and written in chunks, so a large export never
+holds the whole selection in memory. Parquet and Arrow output need the optional pyarrow package.
+
+Usage:
+    python pm_export.py OUTPUT --start "2024-04-12 01:00" --end "2024-04-19 00:00" [--stations 54t,02t]
+                        [--variables pm25,humidity] [--aggregation D] [--format parquet]
+"""
+import os
+import numpy as np
+import pandas as pd
+from pm_ingest import chronological_keys
+from pm_storage import VARIABLES
+
+EXPORT_FORMATS = {".csv": "csv", ".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+CHUNK_ROWS = 5000
+
+
+def export_format(path, export_type=None):
+    """
+    Get the export format for a path, from the explicit type or the file extension.
+
+    Parameters:
+    - path: The output file
+    - export_type: 'csv', 'parquet' or 'arrow', or None to use the extension
+    """
+    if export_type is None:
+        export_type = EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if export_type not in EXPORT_FORMATS.values():
+        raise ValueError(f"Unsupported export format for {path}; use one of {', '.join(sorted(EXPORT_FORMATS))}")
+    return export_type
+
+
+def iter_chunks(model, stations, variables, start, end, aggregation=None, chunk_rows=CHUNK_ROWS):
+    """
+    Produce the selected data as long-format DataFrames with columns time, station and one per variable.
+
+    Parameters:
+    - model: The AirQualityModel to export from
+    - stations: The station names to export
+    - variables: The variable names to export ('pm25', 'temperature', 'humidity')
+    - start: The start datetime (inclusive), the first hour of the data if None
+    - end: The end datetime (inclusive), the last hour of the data if None
+    - aggregation: None for the raw hourly rows, or a pandas offset alias (e.g. 'D') to average over
+    - chunk_rows: Number of hours per chunk
+
+    Like the files, start and end read "0:00" as the end of the date. Raw rows are written with chronological times,
+    so the files' end-of-day "0:00" rows become midnight of the next day and the time column only runs forward.
+
+    Yields:
+    - DataFrame chunks of at most chunk_rows x len(stations) rows
+    """
+    stations = list(stations)
+    variables = list(variables)
+    if aggregation is not None:
+        # Aggregates are small, so they come from the model's cached query
+        first, last = model.date_bounds()
+        result = model.query(stations, variables, first if start is None else start, last if end is None else end,
+                             aggregation)
+        times = result[variables[0]].index
+        matrices = [result[variable].reindex(index=times, columns=stations).to_numpy(dtype=float)
+                    for variable in variables]
+        for first in range(0, len(times), chunk_rows):
+            rows = slice(first, first + chunk_rows)
+            yield long_frame(times[rows], stations, variables, [matrix[rows] for matrix in matrices])
+        return
+
+    reference = variables[0]
+    times = model.frame_times(reference)
+    keys = chronological_keys(pd.DatetimeIndex(times).as_unit("ns").asi8)
+    in_range = np.ones(len(keys), dtype=bool)
+    if start is not None:
+        in_range &= keys >= chronological_keys([pd.Timestamp(start).value])[0]
+    if end is not None:
+        in_range &= keys <= chronological_keys([pd.Timestamp(end).value])[0]
+    selected = np.flatnonzero(in_range)
+    frames = model.frames()
+    for first in range(0, len(selected), chunk_rows):
+        rows = selected[first:first + chunk_rows]
+        chunk_times = times[rows]
+        matrices = []
+        for variable in variables:
+            variable_rows = rows if variable == reference else model.time_rows(variable, chunk_times)
+            found = variable_rows >= 0
+            values = frames[variable].iloc[np.where(found, variable_rows, 0)].reindex(columns=stations)
+            matrices.append(np.where(found[:, None], values.to_numpy(dtype=float), np.nan))
+        yield long_frame(keys[rows].view("datetime64[ns]"), stations, variables, matrices)
+
+
+def long_frame(times, stations, variables, matrices):
+    """
+    Turn (hours x stations) matrices into a long DataFrame with one row per (time, station).
+    """
+    columns = {'time': np.repeat(pd.DatetimeIndex(times).to_numpy(dtype="datetime64[ns]"), len(stations)),
+               'station': np.tile(np.asarray(stations, dtype=object), len(times))}
+    for variable, matrix in zip(variables, matrices):
+        columns[variable] = matrix.ravel()
+    return pd.DataFrame(columns)
+
+
+def write_chunks(chunks, path, export_type, variables):
+    """
+    Write DataFrame chunks to a file one at a time.
+
+    Parameters:
+    - chunks: Iterable of long-format DataFrames
+    - path: The output file
+    - export_type: 'csv', 'parquet' or 'arrow'
+    - variables: The variable columns of the chunks
+
+    Returns:
+    - Number of rows written
+    """
+    rows_written = 0
+    if export_type == "csv":
+        with open(path, "w", newline="") as file:
+            pd.DataFrame(columns=['time', 'station', *variables]).to_csv(file, index=False)
+            for chunk in chunks:
+                chunk.to_csv(file, index=False, header=False, date_format="%Y-%m-%d %H:%M")
+                rows_written += len(chunk)
+        return rows_written
+
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet and Arrow export need the pyarrow package (pip install pyarrow)") from None
+    schema = pa.schema([('time', pa.timestamp('ns')), ('station', pa.string())]
+                       + [(variable, pa.float64()) for variable in variables])
+    if export_type == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    else:
+        writer = pyarrow.ipc.new_file(path, schema)
+    with writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows_written += len(chunk)
+    return rows_written
+
+
+def export_data(model, path, stations=None, variables=VARIABLES, start=None, end=None, aggregation=None,
+                export_type=None, chunk_rows=CHUNK_ROWS):
+    """
+    Export a selection of the data to a CSV, Parquet or Arrow IPC file in chunks.
+
+    Parameters:
+    - model: The AirQualityModel to export from
+    - path: The output file
+    - stations: The station names, every station of the PM2.5 table if not given
+    - variables: The variable names to export
+    - start: The start datetime, the first hour of the data if not given
+    - end: The end datetime, the last hour of the data if not given
+    - aggregation: None for raw hourly rows, or a pandas offset alias (e.g. 'D') to average over
+    - export_type: 'csv', 'parquet' or 'arrow', or None to use the file extension
+    - chunk_rows: Number of hours written per chunk
+
+    Returns:
+    - Number of rows written
+    """
+    export_type = export_format(path, export_type)
+    if stations is None:
+        stations = list(model.pm25_data.columns[3:])
+    chunks = iter_chunks(model, stations, variables, start, end, aggregation, chunk_rows)
+    return write_chunks(chunks, path, export_type, list(variables))
+
+
+if __name__ == "__main__":
+    import argparse
+    from pm_model import AirQualityModel
+
+    parser = argparse.ArgumentParser(description="Export air quality data without the GUI.")
+    parser.add_argument("output", help="output file (.csv, .parquet, .arrow or .feather)")
+    parser.add_argument("--start", help="start date and time, e.g. '2024-04-12 01:00'")
+    parser.add_argument("--end", help="end date and time")
+    parser.add_argument("--stations", help="comma-separated station names (default: all)")
+    parser.add_argument("--variables", default=",".join(VARIABLES), help="comma-separated variables")
+    parser.add_argument("--aggregation", help="pandas offset alias to average over, e.g. 'D' or '6h'")
+    parser.add_argument("--format", choices=sorted(set(EXPORT_FORMATS.values())), help="override the extension")
+    args = parser.parse_args()
+
+    export_variables = args.variables.split(",")
+    unknown_variables = [variable for variable in export_variables if variable not in VARIABLES]
+    if unknown_variables:
+        parser.error(f"unknown variables: {', '.join(unknown_variables)} (choose from {', '.join(VARIABLES)})")
+
+    export_model = AirQualityModel(None, None, None)
+    if export_model.load_data() is None:
+        parser.error("the data files could not be loaded")
+    export_stations = args.stations.split(",") if args.stations else None
+    if export_stations is not None:
+        columns = set(export_model.pm25_data.columns[3:])
+        unknown_stations = [name for name in export_stations if name not in columns]
+        if unknown_stations:
+            parser.error(f"unknown stations: {', '.join(unknown_stations)}")
+    count = export_data(export_model, args.output, stations=export_stations,
+                        variables=export_variables, start=args.start, end=args.end,
+                        aggregation=args.aggregation, export_type=args.format)
+    print(f"Exported {count} rows to {args.output}")
@@ -0,0 +1,109 @@
+"""
+Module: pm_forecast
+
+This module contains the Forecaster class, which fits a short-horizon PM2.5 model for every station at once. Each
+station gets an autoregressive model on the previous hours and the same hour of the previous day, with the previous
+hour's temperature and humidity as covariates. The normal equations of all stations are kept as stacked arrays, so new
+hours are folded in without refitting from scratch and all stations are solved in one batched call.
+"""
+import numpy as np
+
+DEFAULT_HORIZON = 6
+DEFAULT_RIDGE = 1e-3
+# Lags of PM2.5 used as features; the largest one is the daily season
+PM25_LAGS = (1, 2, 24)
+SEASON = max(PM25_LAGS)
+
+
+class Forecaster:
+    def __init__(self, ridge=DEFAULT_RIDGE):
+        """
+        Initialize the Forecaster object.
+
+        Parameters:
+        - ridge: Ridge penalty added to the normal equations to keep short or flat series solvable
+        """
+        self.ridge = ridge
+        self.n_features = 1 + len(PM25_LAGS) + 2
+        self.xtx = None
+        self.xty = None
+        self.rows_fitted = 0
+        self.coefficients = None
+
+    @staticmethod
+    def features(pm25, temperature, humidity, rows):
+        """
+        Build the feature vectors for predicting the given rows.
+
+        Parameters:
+        - pm25, temperature, humidity: (hours x stations) arrays with the same rows and columns
+        - rows: Row positions to predict, each at least SEASON
+
+        Returns:
+        - A (rows x stations x features) array
+        """
+        rows = np.asarray(rows)
+        columns = [np.ones((len(rows), pm25.shape[1]))]
+        columns += [pm25[rows - lag] for lag in PM25_LAGS]
+        columns += [temperature[rows - 1], humidity[rows - 1]]
+        return np.stack(columns, axis=2)
+
+    def fit(self, pm25, temperature, humidity):
+        """
+        Fit every station's model from scratch.
+
+        Parameters:
+        - pm25, temperature, humidity: (hours x stations) arrays with the same rows and columns
+        """
+        n_stations = pm25.shape[1]
+        self.xtx = np.zeros((n_stations, self.n_features, self.n_features))
+        self.xty = np.zeros((n_stations, self.n_features))
+        self.rows_fitted = SEASON
+        self.update(pm25, temperature, humidity)
+
+    def update(self, pm25, temperature, humidity):
+        """
+        Fold the hours added since the last fit into the normal equations and solve again.
+
+        Parameters:
+        - pm25, temperature, humidity: The full (hours x stations) arrays, including the hours already fitted
+        """
+        if self.xtx is None or self.xtx.shape[0] != pm25.shape[1]:
+            self.fit(pm25, temperature, humidity)
+            return
+        rows = np.arange(max(self.rows_fitted, SEASON), len(pm25))
+        if len(rows):
+            x = self.features(pm25, temperature, humidity, rows)
+            y = pm25[rows]
+            # Hours with any missing input are left out of that station's fit
+            usable = ~(np.isnan(x).any(axis=2) | np.isnan(y))
+            x = np.where(usable[:, :, None], x, 0.0)
+            y = np.where(usable, y, 0.0)
+            self.xtx += np.einsum("tsi,tsj->sij", x, x)
+            self.xty += np.einsum("tsi,ts->si", x, y)
+            self.rows_fitted = len(pm25)
+        penalty = self.ridge * np.eye(self.n_features)
+        self.coefficients = np.linalg.solve(self.xtx + penalty, self.xty[:, :, None])[:, :, 0]
+
+    def forecast(self, pm25, temperature, humidity, horizon=DEFAULT_HORIZON):
+        """
+        Forecast the next hours of every station, feeding each prediction back in for the following hour.
+
+        Covariates for future hours are taken from the same hour of the previous day.
+
+        Parameters:
+        - pm25, temperature, humidity: The (hours x stations) history arrays
+        - horizon: Number of hours to forecast
+
+        Returns:
+        - A (horizon x stations) array of forecasts
+        """
+        n_rows = len(pm25)
+        pm25 = np.vstack([pm25, np.full((horizon, pm25.shape[1]), np.nan)])
+        temperature = np.vstack([temperature, temperature[n_rows - SEASON:n_rows - SEASON + horizon]])
+        humidity = np.vstack([humidity, humidity[n_rows - SEASON:n_rows - SEASON + horizon]])
+        for step in range(horizon):
+            row = n_rows + step
+            x = self.features(pm25, temperature, humidity, [row])[0]
+            pm25[row] = np.maximum(np.einsum("si,si->s", x, self.coefficients), 0.0)
+        return pm25[n_rows:]
@@ -0,0 +1,178 @@
+"""
+Module: pm_gaps
+
+This module contains the missing-data stage of the air quality analysis tool. Missing readings are recorded per station
+as packed bitsets, short gaps are interpolated along time, and whatever is left is filled from the nearest stations.
+Every step works on whole (times x stations) matrices at once.
+"""
+import numpy as np
+
+DEFAULT_MAX_GAP = 3
+DEFAULT_NEIGHBOURS = 3
+
+
+def missing_bitset(matrix):
+    """
+    Pack the missing readings of a matrix into a bitset, 8 rows per byte for each station.
+
+    Parameters:
+    - matrix: A (times x stations) array of readings
+
+    Returns:
+    - A (ceil(times / 8) x stations) uint8 array
+    """
+    return pack_missing(np.isnan(matrix))
+
+
+def pack_missing(mask):
+    """
+    Pack a boolean missing mask into a bitset, 8 rows per byte for each station.
+
+    Parameters:
+    - mask: A (times x stations) boolean array, True where the reading is missing
+    """
+    return np.packbits(mask, axis=0)
+
+
+def unpack_missing(bitset, n_rows):
+    """
+    Unpack a bitset made by missing_bitset back to a boolean mask.
+
+    Parameters:
+    - bitset: The packed bitset
+    - n_rows: Number of rows of the original matrix
+
+    Returns:
+    - A (times x stations) boolean array, True where the reading was missing
+    """
+    return np.unpackbits(bitset, axis=0, count=n_rows).astype(bool)
+
+
+def interpolate_gaps(matrix, max_gap, times=None):
+    """
+    Linearly interpolate runs of missing readings no longer than max_gap rows.
+
+    Longer runs, and runs at the start or end of a column, are left missing.
+
+    Parameters:
+    - matrix: A (times x stations) array of readings
+    - max_gap: The longest run of missing rows to fill
+    - times: Timestamps of the rows to interpolate against, or None to treat rows as evenly spaced
+
+    Returns:
+    - The interpolated matrix (the input itself if nothing was filled)
+    """
+    missing = np.isnan(matrix)
+    if not missing.any():
+        return matrix
+    n_rows = matrix.shape[0]
+    rows = np.broadcast_to(np.arange(n_rows)[:, None], matrix.shape)
+    # Index of the last reading at or before each row, and of the first reading at or after it
+    previous = np.maximum.accumulate(np.where(missing, -1, rows), axis=0)
+    following = np.minimum.accumulate(np.where(missing, n_rows, rows)[::-1], axis=0)[::-1]
+    fill = missing & (previous >= 0) & (following < n_rows) & (following - previous - 1 <= max_gap)
+    if not fill.any():
+        return matrix
+
+    columns = np.broadcast_to(np.arange(matrix.shape[1]), matrix.shape)[fill]
+    before, after, row = previous[fill], following[fill], rows[fill]
+    if times is None:
+        position = np.arange(n_rows, dtype=float)
+    else:
+        position = np.asarray(times, dtype="datetime64[ns]").view("i8")
+    weight = (position[row] - position[before]) / (position[after] - position[before])
+    filled = matrix.copy()
+    filled[fill] = matrix[before, columns] + weight * (matrix[after, columns] - matrix[before, columns])
+    return filled
+
+
+class GapFiller:
+    def __init__(self, registry, max_gap=DEFAULT_MAX_GAP, method="linear", neighbours=DEFAULT_NEIGHBOURS):
+        """
+        Initialize the GapFiller object.
+
+        Parameters:
+        - registry: StationRegistry used to find each station's nearest neighbours
+        - max_gap: The longest run of missing hours to interpolate, 0 to skip interpolation
+        - method: 'linear' to treat rows as evenly spaced, 'time' to interpolate against the timestamps
+        - neighbours: Number of nearest stations used for the spatial fill, 0 to skip it
+        """
+        if method not in ("linear", "time"):
+            raise ValueError(f"Unknown interpolation method: {method}")
+        self.registry = registry
+        self.max_gap = max_gap
+        self.method = method
+        self.neighbours = neighbours
+        self._neighbour_cache = {}
+
+    def neighbour_weights(self, stations):
+        """
+        Get the nearest stations of each station and their inverse-distance weights.
+
+        Parameters:
+        - stations: Station names of the matrix columns
+
+        Returns:
+        - Tuple of (stations x k) column indices and (stations x k) weights, or None if a station is not registered
+        """
+        stations = tuple(stations)
+        if stations not in self._neighbour_cache:
+            if any(name not in self.registry for name in stations) or len(stations) < 2:
+                self._neighbour_cache[stations] = None
+            else:
+                nearest, distances = self.registry.nearest_neighbours(stations, self.neighbours)
+                self._neighbour_cache[stations] = (nearest, 1 / np.maximum(distances, 1e-6))
+        return self._neighbour_cache[stations]
+
+    def spatial_fill(self, matrix, stations, empty=None):
+        """
+        Fill missing readings with the inverse-distance weighted mean of the nearest stations at the same time.
+
+        Parameters:
+        - matrix: A (times x stations) array of readings
+        - stations: Station names of the matrix columns
+        - empty: Boolean array of the stations with no readings at all, which are left empty; the columns of the
+          matrix that are entirely missing if not given
+
+        Returns:
+        - The filled matrix (the input itself if nothing was filled)
+        """
+        missing = np.isnan(matrix)
+        neighbour_weights = self.neighbour_weights(stations) if self.neighbours else None
+        if neighbour_weights is None or not missing.any():
+            return matrix
+        nearest, weights = neighbour_weights
+        rows = np.flatnonzero(missing.any(axis=1))
+        values = matrix[rows][:, nearest]
+        valid = ~np.isnan(values)
+        weights = np.where(valid, weights, 0.0)
+        total = weights.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            estimate = (np.where(valid, values, 0.0) * weights).sum(axis=2) / total
+        # Stations with no readings at all are left empty rather than invented from their neighbours
+        if empty is None:
+            empty = missing.all(axis=0)
+        fill = missing[rows] & (total > 0) & ~empty
+        filled = matrix.copy()
+        block = filled[rows]
+        block[fill] = estimate[fill]
+        filled[rows] = block
+        return filled
+
+    def fill(self, matrix, stations, times=None, interpolate=True, empty=None):
+        """
+        Run the gap-handling stage: time interpolation of short gaps followed by the spatial fill.
+
+        Parameters:
+        - matrix: A (times x stations) array of readings
+        - stations: Station names of the matrix columns
+        - times: Timestamps of the rows, used by the 'time' method
+        - interpolate: False to skip time interpolation (e.g. for rows that have no later readings yet)
+        - empty: Boolean array of the stations with no readings at all, see spatial_fill
+
+        Returns:
+        - The cleaned matrix (the input itself if there was nothing to fill)
+        """
+        if interpolate and self.max_gap > 0:
+            matrix = interpolate_gaps(matrix, self.max_gap, times if self.method == "time" else None)
+        return self.spatial_fill(matrix, stations, empty)
@@ -0,0 +1,171 @@
+"""
+Module: pm_ingest
+
+This module contains the ingestion pipeline of the air quality analysis tool. The variable CSV files are parsed
+concurrently in a process pool, checked for duplicate timestamps, hourly gaps and station columns that do not match,
+and aligned on timestamp into a single ReadingStore in one pass.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pm_storage import ReadingStore
+
+DAY_NS = 24 * 3600 * 10 ** 9
+# Below this total file size, starting worker processes costs more than parsing the files one after another
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+
+
+def chronological_keys(times):
+    """
+    Get sort keys that order timestamps the way the files do.
+
+    The files write the last hour of a day as "0:00" of that same date, so a midnight timestamp sorts after the other
+    hours of its date instead of before them.
+
+    Parameters:
+    - times: int64 timestamps in nanoseconds
+
+    Returns:
+    - An int64 array of keys, the timestamps with midnight moved to the end of its date
+    """
+    times = np.asarray(times, dtype=np.int64)
+    return times + np.where(times % DAY_NS == 0, DAY_NS, 0)
+
+
+def parse_variable_file(path):
+    """
+    Parse one variable CSV file into plain arrays.
+
+    This runs in a worker process, so it returns arrays rather than a DataFrame to keep the transfer cheap.
+
+    Parameters:
+    - path: The CSV file in the layout No., date, time, stations...
+
+    Returns:
+    - Tuple of (station names, int64 timestamps in nanoseconds, (rows x stations) float array)
+    """
+    frame = pd.read_csv(path)
+    stations = list(frame.columns[3:])
+    times = pd.to_datetime(frame['date'] + ' ' + frame['time']).to_numpy(dtype="datetime64[ns]").view("i8")
+    return stations, times, frame[stations].to_numpy(dtype=float)
+
+
+class IngestReport:
+    def __init__(self):
+        """
+        Initialize the IngestReport object.
+        """
+        self.rows = {}
+        self.columns = {}
+        self.duplicates = {}
+        self.missing_times = {}
+        self.unknown_stations = {}
+        self.missing_stations = {}
+        self.gaps = pd.DatetimeIndex([])
+
+    def has_problems(self):
+        """
+        Check if any file had duplicates, missing rows, gaps or mismatched station columns.
+        """
+        per_file = (self.duplicates, self.missing_times, self.unknown_stations, self.missing_stations)
+        return len(self.gaps) > 0 or any(len(values) for problems in per_file for values in problems.values())
+
+    def summary(self):
+        """
+        Describe the ingestion result as text.
+        """
+        lines = []
+        for variable, rows in self.rows.items():
+            lines.append(f"{variable}: {rows} rows, {len(self.duplicates[variable])} duplicate timestamps, "
+                         f"{len(self.missing_times[variable])} timestamps missing")
+            if self.unknown_stations[variable]:
+                lines.append(f"  stations not in the station list: {', '.join(self.unknown_stations[variable])}")
+            if self.missing_stations[variable]:
+                lines.append(f"  stations without a column: {', '.join(self.missing_stations[variable])}")
+        if len(self.gaps):
+            lines.append(f"{len(self.gaps)} hours missing from every file, first at {self.gaps[0]}")
+        return "\n".join(lines)
+
+
+def ingest(paths, stations=None, max_workers=None):
+    """
+    Parse, validate and align the variable CSV files.
+
+    Large files are parsed in parallel, so the wall time is bounded by the slowest file rather than the sum. The rows
+    of the aligned matrices are every timestamp found in any file, in chronological order.
+
+    Parameters:
+    - paths: Dictionary mapping variable name to its CSV file; the first entry's station columns are the default
+      column order
+    - stations: Column order of the aligned matrices, the first file's station columns if not given
+    - max_workers: Number of worker processes; if not given, one per file when the files add up to at least
+      PARALLEL_MIN_BYTES and serial otherwise; 1 parses serially
+
+    Returns:
+    - Tuple of (ReadingStore aligned on timestamp, IngestReport)
+    """
+    variables = list(paths)
+    workers = max_workers
+    if workers is None:
+        total_bytes = sum(os.path.getsize(path) for path in paths.values())
+        workers = len(variables) if total_bytes >= PARALLEL_MIN_BYTES else 1
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = dict(zip(variables, executor.map(parse_variable_file, paths.values())))
+    else:
+        parsed = {variable: parse_variable_file(path) for variable, path in paths.items()}
+
+    if stations is None:
+        stations = parsed[variables[0]][0]
+    stations = list(stations)
+    station_index = pd.Index(stations)
+
+    # The time axis is every timestamp seen in any file, each at its chronological position
+    all_times = pd.unique(np.concatenate([times for _, times, _ in parsed.values()]))
+    keys = chronological_keys(all_times)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    if np.any(np.diff(keys) <= 0):
+        raise ValueError("The aligned time axis is not strictly increasing")
+    time_axis = pd.Index(all_times[order])
+
+    report = IngestReport()
+    matrices = {}
+    for variable, (columns, times, values) in parsed.items():
+        times_index = pd.Index(times)
+        duplicated = times_index.duplicated(keep="first")
+        rows = np.flatnonzero(~duplicated)
+        positions = time_axis.get_indexer(times_index[rows])
+        column_positions = station_index.get_indexer(columns)
+        known = column_positions >= 0
+
+        matrix = np.full((len(time_axis), len(stations)), np.nan)
+        matrix[np.ix_(positions, column_positions[known])] = values[np.ix_(rows, np.flatnonzero(known))]
+        matrices[variable] = matrix
+
+        present = np.zeros(len(time_axis), dtype=bool)
+        present[positions] = True
+        report.rows[variable] = len(times)
+        report.columns[variable] = columns
+        report.duplicates[variable] = pd.to_datetime(times_index[duplicated].to_numpy())
+        report.missing_times[variable] = pd.to_datetime(time_axis[~present].to_numpy())
+        report.unknown_stations[variable] = [name for name, ok in zip(columns, known) if not ok]
+        column_set = set(columns)
+        report.missing_stations[variable] = [name for name in stations if name not in column_set]
+
+    dates_times = pd.to_datetime(time_axis.to_numpy())
+    if len(keys):
+        hours = np.arange(keys[0], keys[-1] + 1, 3600 * 10 ** 9)
+        gap_keys = np.setdiff1d(hours, keys)
+        # Back to the files' labels, where the end of a day is "0:00" of that day
+        report.gaps = pd.to_datetime(gap_keys - np.where(gap_keys % DAY_NS == 0, DAY_NS, 0))
+    return ReadingStore(stations, dates_times, matrices, file_rows=dict(report.rows)), report
+
+
+if __name__ == "__main__":
+    from pm_model import DATA_FILES
+    from pm_stations import StationRegistry
+
+    _, ingest_report = ingest(DATA_FILES, StationRegistry.load().names)
+    print(ingest_report.summary())
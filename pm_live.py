@@ -0,0 +1,82 @@
+"""
+Module: pm_live
+
+This module contains the CsvTailer and LiveFeed classes, which follow the air quality CSV files as sensors append new
+hourly rows so the model can be updated incrementally instead of reloading every file.
+"""
+import io
+import os
+import pandas as pd
+
+
+class CsvTailer:
+    def __init__(self, path, skip_rows=0):
+        """
+        Initialize the CsvTailer object.
+
+        Parameters:
+        - path: The CSV file to follow
+        - skip_rows: Number of data rows already loaded, which are not returned again
+        """
+        self.path = path
+        self.header = ""
+        self.offset = 0
+        self._partial = ""
+        self._seek_past(skip_rows)
+
+    def _seek_past(self, skip_rows):
+        """
+        Move the read offset past the header and the given number of data rows.
+        """
+        with open(self.path, "r", newline="") as file:
+            self.header = file.readline()
+            for _ in range(skip_rows):
+                if not file.readline():
+                    break
+            self.offset = file.tell()
+
+    def poll(self):
+        """
+        Read the complete rows appended since the last poll.
+
+        Returns:
+        - DataFrame of the new rows with the file's columns (empty if nothing was appended)
+        """
+        if os.path.getsize(self.path) < self.offset:
+            # The file was truncated or replaced, start again after its header
+            self._partial = ""
+            self._seek_past(0)
+        with open(self.path, "r", newline="") as file:
+            file.seek(self.offset)
+            chunk = file.read()
+            self.offset = file.tell()
+
+        text = self._partial + chunk
+        end = text.rfind("\n") + 1
+        # Keep a row that is still being written for the next poll
+        self._partial = text[end:]
+        if not text[:end].strip():
+            return pd.read_csv(io.StringIO(self.header))
+        return pd.read_csv(io.StringIO(self.header + text[:end]))
+
+
+class LiveFeed:
+    def __init__(self, paths, skip_rows=None):
+        """
+        Initialize the LiveFeed object.
+
+        Parameters:
+        - paths: Dictionary mapping variable name to the CSV file to follow
+        - skip_rows: Dictionary mapping variable name to the number of rows already loaded
+        """
+        skip_rows = skip_rows or {}
+        self.tailers = {variable: CsvTailer(path, skip_rows.get(variable, 0)) for variable, path in paths.items()}
+
+    def poll(self):
+        """
+        Read the rows appended to every followed file since the last poll.
+
+        Returns:
+        - Dictionary mapping variable name to a DataFrame of new rows
+        """
+        return {variable: tailer.poll() for variable, tailer in self.tailers.items()}
@@ -5,81 +5,631 @@ This module contains the AirQualityModel class, which represents the model compo
 air quality analysis tool.
 """
 from math import radians, cos, sin, asin, sqrt
+import numpy as np
 import pandas as pd
+from pm_anomaly import AnomalyDetector, ANOMALY_COLUMNS
+from pm_cache import LRUCache
+from pm_forecast import Forecaster, DEFAULT_HORIZON, SEASON
+from pm_gaps import GapFiller, missing_bitset, pack_missing, unpack_missing
+from pm_ingest import chronological_keys, ingest
+from pm_spatial import SpatialGrid
+from pm_storage import ReadingStore, VARIABLES
+from pm_stations import StationRegistry
 
+DATA_FILES = {"pm25": "pm25_data.csv", "temperature": "temperature_data.csv", "humidity": "humidity_data.csv"}
+PM25_BINS = [0, 12, 35.5, 43, 54, 75, 91]
+PM25_CATEGORIES = ['Good', 'Moderate', 'Unhealthy for Sensitive Groups', 'Unhealthy', 'Very Unhealthy', 'Hazardous']
+QUERY_CACHE_SIZE = 64
+SURFACE_CACHE_SIZE = 256
+STATISTICS_COLUMNS = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
 
 
 class AirQualityModel:
-    def __init__(self, pm25_data, temperature_data, humidity_data):
+    def __init__(self, pm25_data, temperature_data, humidity_data, registry=None, data_files=None):
         """
         Initialize the AirQualityModel object.
+
+        Parameters:
+        - pm25_data: DataFrame containing PM2.5 data
+        - temperature_data: DataFrame containing temperature data
+        - humidity_data: DataFrame containing humidity data
+        - registry: StationRegistry with the station metadata, loaded from the station file if not given
+        - data_files: Dictionary mapping variable name to its CSV file, DATA_FILES if not given
         """
         self.pm25_data = pm25_data
         self.temperature_data = temperature_data
         self.humidity_data = humidity_data
+        self.data_files = dict(DATA_FILES if data_files is None else data_files)
+        self.store = None
+        self.file_rows = {}
+        self.registry = registry if registry is not None else StationRegistry.load()
+        self.stations = None
+        self.dates_times = None
+        self.query_cache = LRUCache(QUERY_CACHE_SIZE)
+        self._frame_times = {}
+        self.running_stats = None
+        self.pm25_category_counts = None
+        self.gap_filler = GapFiller(self.registry)
+        self.missing_masks = {}
+        self.surface_grid = None
+        self.surface_cache = LRUCache(SURFACE_CACHE_SIZE)
+        self.anomaly_detector = AnomalyDetector(self.registry)
+        self.anomalies = pd.DataFrame(columns=ANOMALY_COLUMNS)
+        self.forecaster = Forecaster()
+        self._forecast = None
+        self._station_statistics = None
+
+    @classmethod
+    def from_store(cls, path, registry=None, data_files=None):
+        """
+        Create a model backed by a memory-mapped reading store.
+
+        The reading matrices are mapped read-only, so several processes opening the same store share one copy.
+
+        Parameters:
+        - path: The reading store file
+        - registry: StationRegistry with the station metadata, loaded from the station file if not given
+        - data_files: The CSV files the store was built from, followed in live mode
+        """
+        store = ReadingStore.open(path)
+        model = cls(None, None, None, registry=registry, data_files=data_files)
+        model.store = store
+        model.set_readings(store)
+        model.check_stations(store.stations)
+        return model
+
+    def save_store(self, path):
+        """
+        Write the readings of the data files to a memory-mapped reading store, aligned on timestamp and gap-filled.
+
+        The missing bitsets are stored with the cleaned readings, so models mapping the store use them as they are
+        and every process shares the mapped copy.
 
-        self.coordinates = {
-            "02t": (13.732209408708636, 100.49011823103785),
-            "11t": (13.77652082459571, 100.57208382984774),
-            "12t": (13.70740370222286, 100.54713976097712),
-            "54t": (13.7642440339872, 100.55418099816625),
-            "53t": (13.795263997529226, 100.59335406939272),
-            "59t": (13.780574801627816, 100.53817599639395),
-            "bkp112t": (13.692982196365548, 100.50245751112156),
-            "bkp115t": (13.81308580514807, 100.5567686963916),
-            "bkp129t": (13.85444675012722, 100.85896905528762),
-            "bkp130t": (13.878003444157178, 100.62044846596419),
-            "bkp128t": (13.720923957921034, 100.78119854362957),
-            "bkp65t": (13.733749553788511, 100.5284046965944),
-            "bkp64t": (13.7641831560783, 100.60572519639112),
-            "bkp72t": (13.668622205457751, 100.63554611418128),
-            "bkp75t": (13.89511672071199, 100.66049639025802),
-            "bkp80t": (13.855566745921893, 100.86250590252648),
-            "bkp90t": (13.638530493326543, 100.37231663749424),
-            "bkp89t": (13.691342780481444, 100.34166561371465),
-            "13t": (13.853442192837056, 100.52714131418323),
-            "16t": (13.620945556760411, 100.56058979294127),
-            "17t": (13.65075664069759, 100.53075974648702),
-            "14t": (13.703493639422767, 100.32169741970371),
-            "18t": (13.599421571021107, 100.59688746446852),
-            "20t": (14.039526298916469, 100.61535386755857),
-            "o10": (13.768086948199999, 100.64999379639114),
-            "50t": (13.732462092201965, 100.53607355528632),
-            "bkp116t": (13.80751017138618, 100.55542457082737),
-            "bkp119t": (13.731408311636821, 100.567930666943),
-            "bkp122t": (13.729544153507362, 100.55871339639071),
-            "bkp121t": (13.652018662123847, 100.49140602199797),
-            "bkp126t": (13.686273866744415, 100.3846529822208),
-            "bkp125t": (13.787043155102085, 100.67442399639135),
-            "bkp133t": (13.769310458423261, 100.49498097860005),
-            "bkp131t": (13.68535165943233, 100.5180536963904),
-            "bkp61t": (13.757332794560948, 100.51466145988448),
-            "bkp60t": (13.776963646331252, 100.51969026875639),
-            "bkp63t": (13.781296032312888, 100.53290028014874),
-            "bkp62t": (13.7422132815451, 100.51353565121386),
-            "bkp92t": (13.76489755604922, 100.49875840804674),
-            "bkp87t": (13.74621662068962, 100.35486787445514),
-            "bkp58t": (13.681947453478756, 100.50580256694248),
-            "bkp57t": (13.702465949899972, 100.60201265528603),
-            "bkp56t": (13.769869283938357, 100.5531413963911),
-            "bkp124t": (13.771875110197714, 100.46815581755364),
-            "bkp123t": (13.807522956576939, 100.55056037860047)}
+        Parameters:
+        - path: The reading store file to write
+        """
+        aligned, report = ingest(self.data_files, self.registry.names)
+        if report.has_problems():
+            print(report.summary())
+        self.clean(aligned).save(path)
 
     def load_data(self):
         """
-        Load data from CSV files.
+        Load data from CSV files, or from the reading store if the model was created from one.
+
+        The CSV files are parsed in parallel and aligned on timestamp, so every table has the same rows in the same
+        order; duplicates, gaps and mismatched station columns are reported.
         """
+        if self.store is not None:
+            self.stations = pd.Index(self.store.stations)
+            self.dates_times = pd.Series(self.store.dates_times)
+            self.file_rows = dict(self.store.file_rows or {})
+            self.refresh_caches()
+            print("Data loaded successfully.")
+            return self.dates_times, self.stations
         try:
-            self.pm25_data = pd.read_csv("pm25_data.csv")
-            self.temperature_data = pd.read_csv("temperature_data.csv")
-            self.humidity_data = pd.read_csv("humidity_data.csv")
-            self.stations = self.pm25_data.columns[3:]
-            self.dates_times = pd.to_datetime(self.pm25_data['date'] + ' ' + self.pm25_data['time'])
+            aligned, report = ingest(self.data_files, self.registry.names)
+            if report.has_problems():
+                print(report.summary())
+            self.set_readings(aligned)
+            self.check_stations(report.columns["pm25"])
+            pm25_columns = set(report.columns["pm25"])
+            self.stations = pd.Index([name for name in aligned.stations if name in pm25_columns])
+            self.dates_times = pd.Series(aligned.dates_times)
+            self.file_rows = dict(aligned.file_rows)
+            self.refresh_caches()
             print("Data loaded successfully.")
             return self.dates_times, self.stations
         except FileNotFoundError:
             print("CSV file not found.")
 
+    def clean(self, store):
+        """
+        Run the gap-handling stage on a store's matrices.
+
+        The missing readings are kept as per-station bitsets before filling. A store that already has bitsets was
+        cleaned when it was written and is returned as it is.
+
+        Parameters:
+        - store: ReadingStore with the aligned readings
+
+        Returns:
+        - ReadingStore with the gap-filled matrices and the missing bitsets
+        """
+        if store.missing is not None:
+            return store
+        missing = {variable: missing_bitset(matrix) for variable, matrix in store.matrices.items()}
+        matrices = store.matrices
+        if self.gap_filler is not None:
+            matrices = {variable: self.gap_filler.fill(matrix, store.stations, store.dates_times)
+                        for variable, matrix in matrices.items()}
+        return ReadingStore(store.stations, store.dates_times, matrices, missing=missing, file_rows=store.file_rows)
+
+    def set_readings(self, store):
+        """
+        Clean a store's readings and set the data tables from the result.
+
+        The cleaned tables are what every chart and statistic reads, so the filling is done once per load, or once
+        when a reading store is written.
+
+        Parameters:
+        - store: ReadingStore with the aligned readings
+        """
+        cleaned = self.clean(store)
+        self.missing_masks = dict(cleaned.missing)
+        if self.gap_filler is None and store.missing is not None:
+            # The store holds filled readings; put the gaps back to keep the raw readings
+            n_rows = len(store.dates_times)
+            cleaned = ReadingStore(store.stations, store.dates_times,
+                                   {variable: np.where(unpack_missing(store.missing[variable], n_rows), np.nan, matrix)
+                                    for variable, matrix in store.matrices.items()})
+        self.pm25_data = cleaned.frame("pm25")
+        self.temperature_data = cleaned.frame("temperature")
+        self.humidity_data = cleaned.frame("humidity")
+        self.surface_grid = None
+
+    def missing_mask(self, variable):
+        """
+        Get where readings of a variable were missing before gap handling.
+
+        Parameters:
+        - variable: The variable name ('pm25', 'temperature' or 'humidity')
+
+        Returns:
+        - A (rows x stations) boolean array in the column order of the data table
+        """
+        return unpack_missing(self.missing_masks[variable], len(self.frames()[variable]))
+
+    def frames(self):
+        """
+        Get the data tables keyed by variable name ('pm25', 'temperature', 'humidity').
+        """
+        return {"pm25": self.pm25_data, "temperature": self.temperature_data, "humidity": self.humidity_data}
+
+    def readings(self, frame):
+        """
+        Get the station readings of a data table as a (rows x stations) array in registry order.
+
+        Stations in the registry without a column in the table are filled with NaN.
+
+        Parameters:
+        - frame: DataFrame in the CSV layout
+        """
+        return frame.reindex(columns=self.registry.names).to_numpy(dtype=float)
+
+    def date_bounds(self):
+        """
+        Get the first and last timestamps of the PM2.5 data.
+
+        Returns:
+        - Tuple of (first, last) datetimes, or (None, None) if no data is loaded
+        """
+        if self.pm25_data is None or len(self.pm25_data) == 0:
+            return None, None
+        dates_times = pd.to_datetime(self.pm25_data['date'] + ' ' + self.pm25_data['time'])
+        return dates_times.min().to_pydatetime(), dates_times.max().to_pydatetime()
+
+    def refresh_caches(self):
+        """
+        Rebuild the derived caches (running statistics, PM2.5 category counts, anomalies and forecast fits) from the
+        loaded data.
+        """
+        n_stations = len(self.registry)
+        self.running_stats = {variable: {"count": np.zeros(n_stations), "sum": np.zeros(n_stations),
+                                         "sum_sq": np.zeros(n_stations), "min": np.full(n_stations, np.inf),
+                                         "max": np.full(n_stations, -np.inf)}
+                              for variable in VARIABLES}
+        self.pm25_category_counts = np.zeros((n_stations, len(PM25_CATEGORIES)), dtype=np.int64)
+        self._accumulate(self.frames())
+        self.data_changed()
+        self.anomalies = self.detect_anomalies()
+        self.forecaster = Forecaster()
+
+    def observed_readings(self, variable, rows):
+        """
+        Get the readings of the last rows of a data table in registry order, NaN where the reading was missing before
+        gap handling.
+
+        Parameters:
+        - variable: The variable name ('pm25', 'temperature' or 'humidity')
+        - rows: The last rows of the variable's data table
+
+        Returns:
+        - A (rows x stations) array in registry order
+        """
+        values = self.readings(rows)
+        if variable in self.missing_masks:
+            columns = self.frames()[variable].columns[3:]
+            missing = pd.DataFrame(self.missing_mask(variable)[len(self.frames()[variable]) - len(rows):],
+                                   columns=columns)
+            values = np.where(missing.reindex(columns=self.registry.names, fill_value=True).to_numpy(), np.nan, values)
+        return values
+
+    def _accumulate(self, new_rows):
+        """
+        Fold new rows into the running statistics and PM2.5 category counts.
+
+        The running statistics only take the readings that were not missing before gap handling; the category counts
+        take every reading of the data table.
+
+        Parameters:
+        - new_rows: Dictionary mapping variable name to the rows at the end of its data table
+        """
+        for variable, rows in new_rows.items():
+            if rows is None or len(rows) == 0:
+                continue
+            values = self.observed_readings(variable, rows)
+            stats = self.running_stats[variable]
+            stats["count"] += np.count_nonzero(~np.isnan(values), axis=0)
+            stats["sum"] += np.nansum(values, axis=0)
+            stats["sum_sq"] += np.nansum(values ** 2, axis=0)
+            np.fmin(stats["min"], np.fmin.reduce(values, axis=0, initial=np.inf), out=stats["min"])
+            np.fmax(stats["max"], np.fmax.reduce(values, axis=0, initial=-np.inf), out=stats["max"])
+            if variable == "pm25":
+                self.pm25_category_counts += self.categorize_counts(self.readings(rows))
+
+    @staticmethod
+    def categorize(values, clip=False):
+        """
+        Get the PM25_CATEGORIES index of each PM2.5 reading.
+
+        Parameters:
+        - values: An array of PM2.5 readings
+        - clip: True to put readings above the last bin in the last category instead of leaving them out
+
+        Returns:
+        - An int array of the same shape, -1 for readings that are missing or outside the bins (like pd.cut)
+        """
+        n_categories = len(PM25_CATEGORIES)
+        # Bins are right-inclusive, so (bins[i], bins[i + 1]] lands on index i
+        categories = np.searchsorted(PM25_BINS, values, side="left") - 1
+        if clip:
+            categories = np.minimum(categories, n_categories - 1)
+        valid = (categories >= 0) & (categories < n_categories) & ~np.isnan(values)
+        return np.where(valid, categories, -1)
+
+    @staticmethod
+    def categorize_counts(values):
+        """
+        Count PM2.5 readings per station in each category of PM25_BINS.
+
+        Readings outside the bins or missing are not counted, like pd.cut.
+
+        Parameters:
+        - values: A (rows x stations) array of PM2.5 readings
+
+        Returns:
+        - A (stations x categories) array of counts
+        """
+        n_categories = len(PM25_CATEGORIES)
+        categories = AirQualityModel.categorize(values)
+        valid = categories >= 0
+        stations = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+        flat = stations[valid] * n_categories + categories[valid]
+        return np.bincount(flat, minlength=values.shape[1] * n_categories).reshape(values.shape[1], n_categories)
+
+    def pm25_category_distribution(self, station):
+        """
+        Get the number of PM2.5 readings of a station in each category, from the running category counts.
+
+        Parameters:
+        - station: The station name
+
+        Returns:
+        - Series of counts indexed by PM25_CATEGORIES
+        """
+        return pd.Series(self.pm25_category_counts[self.registry.index_of(station)], index=PM25_CATEGORIES)
+
+    def append_rows(self, new_rows):
+        """
+        Append newly arrived rows to the data tables and update the derived caches incrementally.
+
+        Parameters:
+        - new_rows: Dictionary mapping variable name to a DataFrame of new rows in the CSV layout
+
+        Returns:
+        - Dictionary mapping variable name to the appended rows after gap handling
+        """
+        cleaned_rows = {}
+        pm25_rows_before = 0 if self.pm25_data is None else len(self.pm25_data)
+        for variable, rows in new_rows.items():
+            if rows is None or len(rows) == 0:
+                continue
+            attribute = f"{variable}_data"
+            self.file_rows[variable] = self.file_rows.get(variable, 0) + len(rows)
+            rows = self.clean_rows(variable, rows)
+            cleaned_rows[variable] = rows
+            setattr(self, attribute, pd.concat([getattr(self, attribute), rows], ignore_index=True))
+            if variable == "pm25" and self.dates_times is not None:
+                new_times = pd.to_datetime(rows['date'] + ' ' + rows['time'])
+                self.dates_times = pd.concat([self.dates_times, new_times], ignore_index=True)
+        # The tables no longer match the mapped store, so later loads go back to the CSV files
+        self.store = None
+        if self.running_stats is None:
+            self.refresh_caches()
+        else:
+            self._accumulate(cleaned_rows)
+            self.data_changed()
+            if "pm25" in cleaned_rows:
+                new_anomalies = self.detect_anomalies(start_row=pm25_rows_before)
+                self.anomalies = pd.concat([self.anomalies, new_anomalies], ignore_index=True)
+        return cleaned_rows
+
+    def detect_anomalies(self, start_row=0):
+        """
+        Flag anomalous PM2.5 readings of the registered stations.
+
+        Readings that were filled in by the gap-handling stage are not judged.
+
+        Parameters:
+        - start_row: Only rows from this one on are checked, the earlier ones serve as history
+
+        Returns:
+        - DataFrame with one row per flagged (time, station)
+        """
+        if self.pm25_data is None or len(self.pm25_data) <= start_row:
+            return pd.DataFrame(columns=ANOMALY_COLUMNS)
+        columns = list(self.pm25_data.columns[3:])
+        stations = [name for name in columns if name in self.registry]
+        history = max(start_row - self.anomaly_detector.window, 0)
+        values = self.pm25_data[stations].to_numpy(dtype=float)[history:]
+        if "pm25" in self.missing_masks:
+            missing = self.missing_mask("pm25")[history:, pd.Index(columns).get_indexer(stations)]
+            values = np.where(missing, np.nan, values)
+        return self.anomaly_detector.detect(values, self.frame_times("pm25")[history:], stations,
+                                            start_row=start_row - history)
+
+    def clean_rows(self, variable, rows):
+        """
+        Run the gap-handling stage on newly arrived rows and record their missing readings.
+
+        New rows have no later readings to interpolate towards yet, so only the spatial fill is applied. Whether a
+        station has any readings at all is decided over the whole table, not just the new rows.
+
+        Parameters:
+        - variable: The variable name ('pm25', 'temperature' or 'humidity')
+        - rows: DataFrame of new rows in the CSV layout
+
+        Returns:
+        - DataFrame of the cleaned rows with the data table's station columns
+        """
+        stations = list(self.frames()[variable].columns[3:])
+        values = rows.reindex(columns=stations).to_numpy(dtype=float)
+        if variable in self.missing_masks:
+            missing = np.vstack([self.missing_mask(variable), np.isnan(values)])
+            self.missing_masks[variable] = pack_missing(missing)
+        else:
+            missing = np.vstack([self.frames()[variable][stations].isna().to_numpy(), np.isnan(values)])
+        if self.gap_filler is not None:
+            values = self.gap_filler.fill(values, stations, interpolate=False, empty=missing.all(axis=0))
+        readings = pd.DataFrame(values, columns=stations)
+        return pd.concat([rows[['No.', 'date', 'time']].reset_index(drop=True), readings], axis=1)
+
+    def data_changed(self):
+        """
+        Record that the data tables changed, dropping cached query results and parsed timestamps.
+        """
+        self.query_cache.clear()
+        self.surface_cache.clear()
+        self._forecast = None
+        self._station_statistics = None
+        self._frame_times = {}
+
+    def frame_times(self, variable):
+        """
+        Get the parsed timestamps of a data table, parsing them once until the data changes.
+
+        Parameters:
+        - variable: The variable name ('pm25', 'temperature' or 'humidity')
+        """
+        if variable not in self._frame_times:
+            frame = self.frames()[variable]
+            self._frame_times[variable] = pd.to_datetime(frame['date'] + ' ' + frame['time']).to_numpy()
+        return self._frame_times[variable]
+
+    def query(self, stations, variables, start, end, aggregation=None):
+        """
+        Get the readings of some stations and variables between two datetimes (inclusive).
+
+        Results are kept in an LRU cache keyed on the query, which is cleared whenever the data changes.
+
+        Parameters:
+        - stations: The station names to select
+        - variables: The variable names to select ('pm25', 'temperature', 'humidity')
+        - start: The start datetime
+        - end: The end datetime
+        - aggregation: None for the raw rows, or a pandas offset alias (e.g. 'D') to average over
+
+        Returns:
+        - Dictionary mapping variable name to a DataFrame. Raw results keep the CSV layout (No., date, time,
+          stations...); aggregated results are indexed by period start with one column per station.
+        """
+        stations = tuple(sorted(set(stations)))
+        key = (stations, tuple(variables), pd.Timestamp(start), pd.Timestamp(end), aggregation)
+        result = self.query_cache.get(key)
+        if result is not None:
+            return result
+
+        frames = self.frames()
+        result = {}
+        for variable in variables:
+            times = self.frame_times(variable)
+            mask = (times >= key[2].to_datetime64()) & (times <= key[3].to_datetime64())
+            selected = frames[variable].loc[mask, ['No.', 'date', 'time', *stations]]
+            if aggregation is not None:
+                readings = selected[list(stations)].set_axis(pd.DatetimeIndex(times[mask]))
+                selected = readings.resample(aggregation).mean()
+            result[variable] = selected
+        self.query_cache.put(key, result)
+        return result
+
+    def time_rows(self, variable, timestamps):
+        """
+        Find the row of each timestamp in a data table.
+
+        Parameters:
+        - variable: The variable name ('pm25', 'temperature' or 'humidity')
+        - timestamps: The timestamps to look up
+
+        Returns:
+        - Array of row positions, -1 where the timestamp is not in the table (the first row wins for duplicates)
+        """
+        times = pd.Index(self.frame_times(variable))
+        if not times.is_unique:
+            first_rows = pd.Series(np.arange(len(times)), index=times)
+            first_rows = first_rows[~times.duplicated(keep="first")]
+            return first_rows.reindex(pd.DatetimeIndex(timestamps)).fillna(-1).to_numpy(dtype=np.intp)
+        return times.get_indexer(pd.DatetimeIndex(timestamps))
+
+    def spatial_grid(self):
+        """
+        Get the interpolation grid over the stations of the PM2.5 table, building it on first use.
+        """
+        if self.surface_grid is None:
+            stations = [name for name in self.pm25_data.columns[3:] if name in self.registry]
+            self.surface_grid = SpatialGrid(self.registry, stations)
+        return self.surface_grid
+
+    def pm25_surfaces(self, timestamps):
+        """
+        Get the IDW-interpolated PM2.5 surfaces for several hours.
+
+        Surfaces are cached per hour; the hours not cached yet are interpolated together in one batch.
+
+        Parameters:
+        - timestamps: The hours to get surfaces for
+
+        Returns:
+        - List of (rows x columns) arrays, None for hours without data
+        """
+        keys = [pd.Timestamp(timestamp) for timestamp in timestamps]
+        surfaces = {key: self.surface_cache.get(key) for key in dict.fromkeys(keys)}
+        uncached = [key for key, surface in surfaces.items() if surface is None]
+        if uncached:
+            grid = self.spatial_grid()
+            rows = self.time_rows("pm25", uncached)
+            found = rows >= 0
+            if found.any():
+                readings = self.pm25_data[grid.stations].to_numpy(dtype=float)[rows[found]]
+                for key, surface in zip(np.asarray(uncached, dtype=object)[found], grid.interpolate(readings)):
+                    self.surface_cache.put(key, surface)
+                    surfaces[key] = surface
+        return [surfaces[key] for key in keys]
+
+    def station_frames(self, start, end):
+        """
+        Get the PM2.5 reading and category of every registered station for each hour between two datetimes.
+
+        Everything is read in one batch, so playback only has to index the returned arrays.
+
+        Parameters:
+        - start: The start datetime
+        - end: The end datetime
+
+        Returns:
+        - Tuple of (timestamps, station names, (hours x stations) readings, (hours x stations) category indices)
+        """
+        times = self.frame_times("pm25")
+        mask = (times >= pd.Timestamp(start).to_datetime64()) & (times <= pd.Timestamp(end).to_datetime64())
+        stations = [name for name in self.pm25_data.columns[3:] if name in self.registry]
+        values = self.pm25_data[stations].to_numpy(dtype=float)[mask]
+        return pd.DatetimeIndex(times[mask]), stations, values, self.categorize(values, clip=True)
+
+    def forecast_inputs(self):
+        """
+        Get the PM2.5, temperature and humidity readings of the registered stations on the PM2.5 time axis.
+
+        Returns:
+        - Tuple of (station names, and three (hours x stations) arrays)
+        """
+        stations = [name for name in self.pm25_data.columns[3:] if name in self.registry]
+        pm25_times = self.frame_times("pm25")
+        matrices = [self.pm25_data[stations].to_numpy(dtype=float)]
+        for variable in ("temperature", "humidity"):
+            frame = self.frames()[variable]
+            values = frame.reindex(columns=stations).to_numpy(dtype=float)
+            rows = self.time_rows(variable, pm25_times)
+            matrices.append(np.where((rows >= 0)[:, None], values[rows], np.nan))
+        return stations, *matrices
+
+    def forecast(self, horizon=DEFAULT_HORIZON):
+        """
+        Forecast the next hours of PM2.5 at every registered station.
+
+        The station models are refitted incrementally with any hours added since the last fit, and the forecast is
+        cached until the data changes again.
+
+        Parameters:
+        - horizon: Number of hours to forecast (at most one day)
+
+        Returns:
+        - Tuple of (forecast timestamps, station names, (horizon x stations) array), or None without a day of data
+        """
+        if self._forecast is not None and len(self._forecast[0]) == horizon:
+            return self._forecast
+        if self.pm25_data is None or len(self.pm25_data) <= SEASON or horizon > SEASON:
+            return None
+        stations, pm25, temperature, humidity = self.forecast_inputs()
+        self.forecaster.update(pm25, temperature, humidity)
+        values = self.forecaster.forecast(pm25, temperature, humidity, horizon)
+        # The last row may be a "0:00" row, which the files use for the end of its date
+        last_time = pd.Timestamp(chronological_keys([pd.Timestamp(self.frame_times("pm25")[-1]).value])[0])
+        timestamps = pd.date_range(last_time + pd.Timedelta(hours=1), periods=horizon, freq="h")
+        self._forecast = (timestamps, stations, values)
+        return self._forecast
+
+    def station_statistics(self):
+        """
+        Get descriptive statistics of every variable at every station as one array, cached until the data changes.
+
+        Every statistic is over the readings that were not missing before gap handling. Count, mean, standard
+        deviation, minimum and maximum come from the running statistics; the quartiles are computed for all stations
+        of a variable in one call.
+
+        Returns:
+        - Tuple of ((rows x 2) array of (variable, station) labels, STATISTICS_COLUMNS, (rows x 8) array of values)
+        """
+        if self._station_statistics is not None:
+            return self._station_statistics
+        if self.running_stats is None:
+            self.refresh_caches()
+        labels, values = [], []
+        for variable, frame in self.frames().items():
+            if frame is None:
+                continue
+            stats = self.running_stats[variable]
+            count = stats["count"]
+            has_data = count > 0
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = stats["sum"] / count
+                std = np.sqrt(np.maximum(stats["sum_sq"] - stats["sum"] * mean, 0) / (count - 1))
+                observed = self.observed_readings(variable, frame)[:, has_data]
+                quartiles = np.nanpercentile(observed, [25, 50, 75], axis=0)
+            table = np.column_stack([count, mean, std, stats["min"]])[has_data]
+            table = np.column_stack([table, quartiles.T, stats["max"][has_data]])
+            labels.append(np.column_stack([np.full(has_data.sum(), variable, dtype=object),
+                                           self.registry.names[has_data]]))
+            values.append(table)
+        self._station_statistics = (np.vstack(labels), STATISTICS_COLUMNS, np.vstack(values))
+        return self._station_statistics
+
+    def check_stations(self, stations):
+        """
+        Check that the station columns of the data agree with the station registry.
+
+        Parameters:
+        - stations: Station names found in the data
+
+        Returns:
+        - True if every station in the data is in the registry and vice versa
+        """
+        unknown, missing = self.registry.check(stations)
+        if unknown:
+            print("Stations without metadata:", ", ".join(unknown))
+        if missing:
+            print("Stations without data:", ", ".join(missing))
+        return not unknown and not missing
+
     @staticmethod
     def is_valid_date_range(start_date, end_date):
         """
@@ -107,9 +657,4 @@ class AirQualityModel:
         """
         Find the nearest station to the given latitude and longitude.
         """
-        distances = {}
-        for name, coord in self.coordinates.items():
-            distances[name] = self.haversine(given_lon, given_lat, coord[1], coord[0])
-        nearest_station = min(distances, key=distances.get)
-        nearest_distance = distances[nearest_station]
-        return nearest_station, nearest_distance
+        return self.registry.nearest(given_lat, given_lon)
@@ -0,0 +1,76 @@
+"""
+Module: pm_spatial
+
+This module contains the SpatialGrid class, which interpolates station readings onto a regular latitude/longitude grid
+with inverse distance weighting (IDW). The grid-to-station weights are computed once, so each hour's surface is a single
+matrix product instead of a haversine per grid cell.
+"""
+import numpy as np
+
+DEFAULT_GRID_SHAPE = (24, 24)
+DEFAULT_MARGIN = 0.02
+DEFAULT_POWER = 2
+
+
+class SpatialGrid:
+    def __init__(self, registry, stations=None, shape=DEFAULT_GRID_SHAPE, margin=DEFAULT_MARGIN,
+                 power=DEFAULT_POWER):
+        """
+        Initialize the SpatialGrid object.
+
+        Parameters:
+        - registry: StationRegistry with the station coordinates
+        - stations: Station names of the reading columns, every registry station if not given
+        - shape: Number of (rows, columns) of grid cells
+        - margin: Degrees added around the stations' bounding box
+        - power: The IDW distance exponent
+        """
+        self.stations = list(registry.names if stations is None else stations)
+        indices = registry.indices(self.stations)
+        latitudes = registry.latitudes[indices]
+        longitudes = registry.longitudes[indices]
+        self.shape = shape
+        self.lat_edges = np.linspace(latitudes.min() - margin, latitudes.max() + margin, shape[0] + 1)
+        self.lon_edges = np.linspace(longitudes.min() - margin, longitudes.max() + margin, shape[1] + 1)
+
+        lat_centers = (self.lat_edges[:-1] + self.lat_edges[1:]) / 2
+        lon_centers = (self.lon_edges[:-1] + self.lon_edges[1:]) / 2
+        cell_lat, cell_lon = np.meshgrid(lat_centers, lon_centers, indexing="ij")
+        distances = registry.distance_matrix(cell_lat.ravel(), cell_lon.ravel())[:, indices]
+        # A cell centred on a station takes that station's reading
+        self.weights = 1 / np.maximum(distances, 1e-6) ** power
+
+    def interpolate(self, readings):
+        """
+        Interpolate readings onto the grid.
+
+        Parameters:
+        - readings: A (stations,) array for one hour, or a (hours x stations) array for several
+
+        Returns:
+        - A (rows x columns) array, or an (hours x rows x columns) array; NaN where no station has a reading
+        """
+        readings = np.asarray(readings, dtype=float)
+        single = readings.ndim == 1
+        readings = np.atleast_2d(readings)
+        valid = ~np.isnan(readings)
+        totals = valid.astype(float) @ self.weights.T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            surfaces = (np.where(valid, readings, 0.0) @ self.weights.T) / totals
+        surfaces = surfaces.reshape(len(readings), *self.shape)
+        return surfaces[0] if single else surfaces
+
+    def cells(self):
+        """
+        Get the corner coordinates of every grid cell, row by row.
+
+        Returns:
+        - List of [(lat, lon), ...] polygons, one per cell
+        """
+        polygons = []
+        for i in range(self.shape[0]):
+            for j in range(self.shape[1]):
+                south, north = self.lat_edges[i], self.lat_edges[i + 1]
+                west, east = self.lon_edges[j], self.lon_edges[j + 1]
+                polygons.append([(south, west), (south, east), (north, east), (north, west)])
+        return polygons
@@ -0,0 +1,157 @@
+"""
+Module: pm_stations
+
+This module contains the StationRegistry class, which holds the air quality station metadata loaded from a station
+file. Coordinates are kept as contiguous arrays in registry order, and the same name-to-index mapping is used by the
+nearest-station search and by the column order of the reading matrices.
+"""
+import numpy as np
+import pandas as pd
+
+STATIONS_FILE = "stations.csv"
+EARTH_RADIUS_KM = 6371
+
+
+class StationRegistry:
+    def __init__(self, names, latitudes, longitudes):
+        """
+        Initialize the StationRegistry object.
+
+        Parameters:
+        - names: Station names, in registry order
+        - latitudes: Station latitudes in decimal degrees
+        - longitudes: Station longitudes in decimal degrees
+        """
+        self.names = np.asarray(names, dtype=object)
+        self.latitudes = np.ascontiguousarray(latitudes, dtype=float)
+        self.longitudes = np.ascontiguousarray(longitudes, dtype=float)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if len(self.index) != len(self.names):
+            raise ValueError("Station names in the registry must be unique")
+        self._lat_rad = np.radians(self.latitudes)
+        self._lon_rad = np.radians(self.longitudes)
+        self._cos_lat = np.cos(self._lat_rad)
+
+    @classmethod
+    def load(cls, path=STATIONS_FILE):
+        """
+        Load the registry from a station file with 'station', 'latitude' and 'longitude' columns.
+
+        Parameters:
+        - path: The station file
+        """
+        metadata = pd.read_csv(path, dtype={"station": str}, float_precision="round_trip")
+        return cls(metadata["station"].to_numpy(), metadata["latitude"].to_numpy(),
+                   metadata["longitude"].to_numpy())
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def index_of(self, name):
+        """
+        Get the registry index of a station.
+
+        Parameters:
+        - name: The station name
+        """
+        return self.index[name]
+
+    def indices(self, names):
+        """
+        Get the registry indices of several stations as an array.
+
+        Parameters:
+        - names: The station names
+        """
+        return np.fromiter((self.index[name] for name in names), dtype=np.intp, count=len(names))
+
+    def coordinates(self, name):
+        """
+        Get the (latitude, longitude) of a station.
+
+        Parameters:
+        - name: The station name
+        """
+        i = self.index[name]
+        return self.latitudes[i], self.longitudes[i]
+
+    def distances(self, given_lat, given_lon):
+        """
+        Calculate the great circle distance in kilometers from a point to every station.
+
+        Parameters:
+        - given_lat: Latitude of the point in decimal degrees
+        - given_lon: Longitude of the point in decimal degrees
+
+        Returns:
+        - Array of distances in registry order
+        """
+        lat, lon = np.radians(given_lat), np.radians(given_lon)
+        a = (np.sin((self._lat_rad - lat) / 2) ** 2
+             + np.cos(lat) * self._cos_lat * np.sin((self._lon_rad - lon) / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    def distance_matrix(self, given_lats, given_lons):
+        """
+        Calculate the great circle distance in kilometers from several points to every station at once.
+
+        Parameters:
+        - given_lats: Latitudes of the points in decimal degrees
+        - given_lons: Longitudes of the points in decimal degrees
+
+        Returns:
+        - A (points x stations) array of distances in registry order
+        """
+        lat = np.radians(np.asarray(given_lats, dtype=float))[:, None]
+        lon = np.radians(np.asarray(given_lons, dtype=float))[:, None]
+        a = (np.sin((self._lat_rad - lat) / 2) ** 2
+             + np.cos(lat) * self._cos_lat * np.sin((self._lon_rad - lon) / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    def nearest_neighbours(self, stations, k):
+        """
+        Find the k nearest other stations of each station in a list.
+
+        Parameters:
+        - stations: Station names
+        - k: Number of neighbours per station (at most len(stations) - 1)
+
+        Returns:
+        - Tuple of (stations x k) positions into the given list and (stations x k) distances in kilometers
+        """
+        indices = self.indices(stations)
+        distances = self.distance_matrix(self.latitudes[indices], self.longitudes[indices])[:, indices]
+        np.fill_diagonal(distances, np.inf)
+        k = min(k, len(indices) - 1)
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        return nearest, np.take_along_axis(distances, nearest, axis=1)
+
+    def nearest(self, given_lat, given_lon):
+        """
+        Find the station nearest to the given latitude and longitude.
+
+        Returns:
+        - Tuple of (station name, distance in kilometers)
+        """
+        distances = self.distances(given_lat, given_lon)
+        i = int(np.argmin(distances))
+        return self.names[i], float(distances[i])
+
+    def check(self, stations):
+        """
+        Compare the station columns of a data table against the registry.
+
+        Parameters:
+        - stations: Station names found in the data
+
+        Returns:
+        - Tuple of (stations in the data but not in the registry, registry stations missing from the data)
+        """
+        stations = list(stations)
+        unknown = [name for name in stations if name not in self.index]
+        found = set(stations)
+        missing = [name for name in self.names if name not in found]
+        return unknown, missing
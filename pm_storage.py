@@ -0,0 +1,182 @@
+"""
+Module: pm_storage
+
+This module contains the ReadingStore class, which keeps the PM2.5, temperature and humidity reading matrices of the
+air quality analysis tool in a single memory-mapped file. Several processes (and the GUI) can open the same file
+read-only and share the readings without copying or re-parsing the CSV files.
+
+File layout:
+    - 8 byte magic string and 8 byte little-endian header length
+    - JSON header with the station list, variables, dtype, shape, byte offsets and the row count of each source file
+    - int64 time axis (nanoseconds since the epoch), aligned to ALIGNMENT bytes
+    - one (times x stations) matrix per variable, each aligned to ALIGNMENT bytes
+    - optionally, one packed missing-reading bitset per variable, each aligned to ALIGNMENT bytes; a store with
+      bitsets holds readings that were already gap-filled, and the bitsets record which ones were originally missing
+"""
+import json
+import numpy as np
+import pandas as pd
+
+MAGIC = b"AQSTORE1"
+ALIGNMENT = 4096
+VARIABLES = ("pm25", "temperature", "humidity")
+
+
+def _align(offset):
+    """
+    Round an offset up to the next multiple of ALIGNMENT.
+    """
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class ReadingStore:
+    def __init__(self, stations, dates_times, matrices, path=None, missing=None, file_rows=None):
+        """
+        Initialize the ReadingStore object.
+
+        Parameters:
+        - stations: List of station names, one per matrix column
+        - dates_times: DatetimeIndex of the time axis, one per matrix row
+        - matrices: Dictionary mapping variable name to a (times x stations) array
+        - path: The file the matrices are mapped from, if any
+        - missing: Dictionary mapping variable name to a packed missing bitset, if the matrices are gap-filled
+        - file_rows: Dictionary mapping variable name to the number of data rows read from its CSV file, if known
+        """
+        self.stations = list(stations)
+        self.dates_times = pd.DatetimeIndex(dates_times)
+        self.matrices = matrices
+        self.path = path
+        self.missing = missing
+        self.file_rows = file_rows
+
+    @staticmethod
+    def write(path, stations, dates_times, matrices, missing=None, file_rows=None, dtype="<f8"):
+        """
+        Write the reading matrices to a memory-mappable file.
+
+        Parameters:
+        - path: The file to write
+        - stations: List of station names, one per matrix column
+        - dates_times: Timestamps of the time axis, one per matrix row
+        - matrices: Dictionary mapping variable name to a (times x stations) array
+        - missing: Dictionary mapping variable name to a packed missing bitset, if the matrices are gap-filled
+        - file_rows: Dictionary mapping variable name to the number of data rows read from its CSV file, if known
+        - dtype: The dtype the matrices are stored as
+        """
+        stations = [str(name) for name in stations]
+        times = pd.DatetimeIndex(dates_times).as_unit("ns").asi8.astype("<i8")
+        shape = (len(times), len(stations))
+        dtype = np.dtype(dtype)
+
+        arrays = {}
+        for variable, matrix in matrices.items():
+            array = np.ascontiguousarray(matrix, dtype=dtype)
+            if array.shape != shape:
+                raise ValueError(f"{variable} matrix has shape {array.shape}, expected {shape}")
+            arrays[variable] = array
+        bitsets = {}
+        for variable, bitset in (missing or {}).items():
+            bitsets[variable] = np.ascontiguousarray(bitset, dtype=np.uint8)
+            if bitsets[variable].shape != (-(-shape[0] // 8), shape[1]):
+                raise ValueError(f"{variable} missing bitset has shape {bitsets[variable].shape}")
+
+        # The header size depends on the offsets it records, so lay the file out against a generous upper bound
+        header = {"stations": stations, "variables": list(arrays), "dtype": dtype.str, "shape": shape}
+        if missing is not None:
+            header["missing"] = list(bitsets)
+        if file_rows is not None:
+            header["file_rows"] = {variable: int(rows) for variable, rows in file_rows.items()}
+        header_end = _align(len(MAGIC) + 8 + len(json.dumps(header)) + 64 * (len(arrays) + len(bitsets) + 2))
+        offsets = {"times": header_end}
+        offset = _align(header_end + times.nbytes)
+        for variable, array in arrays.items():
+            offsets[variable] = offset
+            offset = _align(offset + array.nbytes)
+        for variable, bitset in bitsets.items():
+            offsets[f"missing:{variable}"] = offset
+            offset = _align(offset + bitset.nbytes)
+        header["offsets"] = offsets
+        header_bytes = json.dumps(header).encode("utf-8")
+
+        with open(path, "wb") as file:
+            file.write(MAGIC)
+            file.write(len(header_bytes).to_bytes(8, "little"))
+            file.write(header_bytes)
+            file.seek(offsets["times"])
+            file.write(times.tobytes())
+            for variable, array in arrays.items():
+                file.seek(offsets[variable])
+                file.write(array.tobytes())
+            for variable, bitset in bitsets.items():
+                file.seek(offsets[f"missing:{variable}"])
+                file.write(bitset.tobytes())
+            file.truncate(offset)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Map a reading store file read-only.
+
+        Parameters:
+        - path: The file to map
+
+        Returns:
+        - ReadingStore whose matrices are views into the mapped file
+        """
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(raw[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a reading store file")
+        header_start = len(MAGIC) + 8
+        header_length = int.from_bytes(bytes(raw[len(MAGIC):header_start]), "little")
+        header = json.loads(bytes(raw[header_start:header_start + header_length]).decode("utf-8"))
+
+        shape = tuple(header["shape"])
+        offsets = header["offsets"]
+        times = np.ndarray((shape[0],), dtype="<i8", buffer=raw, offset=offsets["times"])
+        matrices = {variable: np.ndarray(shape, dtype=header["dtype"], buffer=raw, offset=offsets[variable])
+                    for variable in header["variables"]}
+        missing = None
+        if "missing" in header:
+            bitset_shape = (-(-shape[0] // 8), shape[1])
+            missing = {variable: np.ndarray(bitset_shape, dtype=np.uint8, buffer=raw,
+                                            offset=offsets[f"missing:{variable}"])
+                       for variable in header["missing"]}
+        return cls(header["stations"], pd.to_datetime(times), matrices, path=path, missing=missing,
+                   file_rows=header.get("file_rows"))
+
+    def save(self, path):
+        """
+        Write this store to a memory-mappable file.
+
+        Parameters:
+        - path: The file to write
+        """
+        ReadingStore.write(path, self.stations, self.dates_times, self.matrices, missing=self.missing,
+                           file_rows=self.file_rows)
+
+    def frame(self, variable):
+        """
+        Get a variable as a DataFrame in the CSV layout (No., date, time, stations...).
+
+        The station columns are backed by the mapped matrix, so no readings are copied.
+
+        Parameters:
+        - variable: The variable name ('pm25', 'temperature' or 'humidity')
+        """
+        times = self.dates_times
+        index_columns = pd.DataFrame({
+            'No.': np.arange(1, len(times) + 1),
+            'date': [f"{t.month}/{t.day}/{t.year}" for t in times],
+            'time': [f"{t.hour}:{t.minute:02d}" for t in times],
+        })
+        readings = pd.DataFrame(self.matrices[variable], columns=self.stations, copy=False)
+        return pd.concat([index_columns, readings], axis=1)
+
+
+if __name__ == "__main__":
+    import sys
+    from pm_model import AirQualityModel
+
+    store_path = sys.argv[1] if len(sys.argv) > 1 else "readings.aqstore"
+    AirQualityModel(None, None, None).save_store(store_path)
+    print(f"Reading store written to {store_path}")
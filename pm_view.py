@@ -5,16 +5,183 @@ This module contains the PMView class, which represents the view component of th
 quality analysis tool.
 """
 from tkinter import messagebox
+import numpy as np
 from customtkinter import *
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from tkintermapview import TkinterMapView
 from geopy.geocoders import Nominatim
 from tkcalendar import DateEntry
-from datetime import datetime
 
-MIN_DATE = datetime(2024, 4, 12, 1, 0)
-MAX_DATE = datetime(2024, 4, 19, 0, 0)
 set_default_color_theme("dark-blue")
+# One color per PM2.5 category of the model, the last one is used for hours without a category
+CATEGORY_COLORS = np.array(["cyan", "lawn green", "gold", "orange", "red", "maroon", "gray"])
+
+
+class StatisticsTable:
+    def __init__(self, parent, visible_rows=15):
+        """
+        Initialize the StatisticsTable object, a table that only creates widgets for the rows on screen.
+
+        Scrolling, sorting and filtering change which rows of the backing arrays are shown; only the visible rows are
+        formatted into the fixed set of labels.
+
+        Parameters:
+        - parent: The parent frame to contain the table
+        - visible_rows: Number of rows shown at once
+        """
+        self.frame = CTkFrame(parent)
+        self.visible_rows = visible_rows
+        self.labels = np.empty((0, 2), dtype=object)
+        self.values = np.empty((0, 0))
+        self.order = np.arange(0)
+        self.offset = 0
+        self.sort_column = None
+        self.sort_descending = False
+
+        top = CTkFrame(self.frame)
+        self.filter_entry = CTkEntry(top, placeholder_text="Filter by variable or station")
+        self.filter_entry.bind("<KeyRelease>", lambda event: self.apply_filter())
+        self.filter_entry.pack(side="left", fill="x", expand=True, padx=5, pady=5)
+        self.count_label = CTkLabel(top, text="")
+        self.count_label.pack(side="left", padx=10)
+        top.pack(side="top", fill="x")
+
+        body = CTkFrame(self.frame)
+        self.grid_frame = CTkFrame(body)
+        self.scrollbar = CTkScrollbar(body, command=self.on_scroll)
+        self.grid_frame.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="left", fill="y")
+        body.pack(side="top", fill="both", expand=True)
+        for widget in (self.grid_frame, body):
+            self.bind_mouse_wheel(widget)
+        self.header = []
+        self.cells = []
+
+    def set_data(self, labels, columns, values):
+        """
+        Replace the rows of the table.
+
+        Parameters:
+        - labels: A (rows x 2) array of (variable, station) labels
+        - columns: Names of the value columns
+        - values: A (rows x columns) array of values
+        """
+        self.labels = labels
+        self.values = values
+        self._search_text = np.char.lower(np.char.add(np.char.add(labels[:, 0].astype(str), " "),
+                                                      labels[:, 1].astype(str)))
+        if len(self.header) != len(columns) + 2:
+            self.build_grid(["Variable", "Station", *columns])
+        self.apply_filter()
+
+    def build_grid(self, headers):
+        """
+        Create the header buttons and the fixed pool of cell labels.
+        """
+        for widget in self.grid_frame.winfo_children():
+            widget.destroy()
+        self.header = []
+        for column, text in enumerate(headers):
+            button = CTkButton(self.grid_frame, text=text, width=80, fg_color="transparent",
+                               command=lambda index=column: self.sort_by(index))
+            button.grid(row=0, column=column, sticky="ew")
+            self.header.append(button)
+        self.cells = []
+        for row in range(self.visible_rows):
+            cells = []
+            for column in range(len(headers)):
+                label = CTkLabel(self.grid_frame, text="", anchor="e" if column >= 2 else "w")
+                label.grid(row=row + 1, column=column, sticky="ew", padx=4)
+                self.bind_mouse_wheel(label)
+                cells.append(label)
+            self.cells.append(cells)
+
+    def apply_filter(self):
+        """
+        Show only the rows whose variable or station contains the filter text, keeping the current sort.
+        """
+        text = self.filter_entry.get().strip().lower()
+        rows = np.arange(len(self.labels))
+        if text:
+            rows = rows[np.char.find(self._search_text, text) >= 0]
+        self.order = self.sorted_rows(rows)
+        self.offset = 0
+        self.render()
+
+    def sorted_rows(self, rows):
+        """
+        Order row indices by the current sort column.
+        """
+        if self.sort_column is None:
+            return rows
+        if self.sort_column < 2:
+            keys = self.labels[rows, self.sort_column].astype(str)
+        else:
+            keys = self.values[rows, self.sort_column - 2]
+        rows = rows[np.argsort(keys, kind="stable")]
+        return rows[::-1] if self.sort_descending else rows
+
+    def sort_by(self, column):
+        """
+        Sort by a column, toggling the direction when it is already the sort column.
+
+        Parameters:
+        - column: Index of the column in the table, 0 and 1 being the labels
+        """
+        self.sort_descending = self.sort_column == column and not self.sort_descending
+        self.sort_column = column
+        self.order = self.sorted_rows(self.order)
+        self.render()
+
+    def on_scroll(self, *args):
+        """
+        Handle the scrollbar's 'moveto' and 'scroll' commands.
+        """
+        if args[0] == "moveto":
+            offset = int(round(float(args[1]) * len(self.order)))
+        else:
+            offset = self.offset + int(args[1]) * (self.visible_rows if args[2] == "pages" else 1)
+        self.scroll_to(offset)
+
+    def bind_mouse_wheel(self, widget):
+        """
+        Scroll the table with the mouse wheel over a widget; X11 sends the wheel as buttons 4 and 5.
+        """
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            widget.bind(sequence, self.on_mouse_wheel)
+
+    def on_mouse_wheel(self, event):
+        """
+        Scroll three rows per mouse wheel notch.
+        """
+        up = event.num == 4 or (event.num != 5 and event.delta > 0)
+        self.scroll_to(self.offset - 3 * (1 if up else -1))
+
+    def scroll_to(self, offset):
+        """
+        Show the rows starting at an offset into the current order.
+        """
+        offset = max(0, min(offset, len(self.order) - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def render(self):
+        """
+        Format only the visible rows into the cell labels.
+        """
+        visible = self.order[self.offset:self.offset + self.visible_rows]
+        for cells, row in zip(self.cells, visible):
+            cells[0].configure(text=self.labels[row, 0])
+            cells[1].configure(text=self.labels[row, 1])
+            for label, value in zip(cells[2:], self.values[row]):
+                label.configure(text=f"{value:.2f}")
+        for cells in self.cells[len(visible):]:
+            for label in cells:
+                label.configure(text="")
+        total = max(len(self.order), 1)
+        self.scrollbar.set(self.offset / total, min((self.offset + self.visible_rows) / total, 1.0))
+        self.count_label.configure(text=f"{len(self.order)} of {len(self.labels)} rows")
 
 
 class AirQualityView:
@@ -25,8 +192,19 @@ class AirQualityView:
         self.root = CTk()
         self.root.title("Bangkok Air Quality Station Analysis Tool")
         self.marker_coord = None
+        self.marker = None
         self.controller = None
         self.nearest_station = "bkp115t"
+        self.min_date = None
+        self.max_date = None
+        self.date_entries = []
+        self.pm_tiles = []
+        self.heatmap_polygons = []
+        self.station_markers = []
+        self.marker_colors = None
+        self.statistics_table = None
+        # Default position is the Department of Computer Engineering Building at Kasetsart University
+        self.map_position = (13.8463425, 100.5685577)
         self.init_components()
 
     def set_controller(self, controller):
@@ -58,10 +236,16 @@ class AirQualityView:
                              command=lambda: self.swap_page(self.home_page))
         graph_btn = CTkButton(frame, text="Graph", fg_color="transparent", font=('bold', 15),
                               command=lambda: self.swap_page(self.graph_page))
+        self.live_switch = CTkSwitch(frame, text="Live", font=('bold', 15),
+                                     command=lambda: self.controller.toggle_live(self.live_switch.get()))
+        self.dataset_combobox = CTkComboBox(frame, state="readonly", values=[],
+                                            command=lambda name: self.controller.select_dataset(name))
         exit_btn = CTkButton(frame, text="Exit", command=self.root.destroy, font=('bold', 15))
 
+        self.dataset_combobox.pack(side="top", padx=10, pady=(40, 0))
         home_btn.pack(side="top", pady=40)
         graph_btn.pack(side="top")
+        self.live_switch.pack(side="top", pady=40)
 
         exit_btn.pack(side="bottom", pady=40)
         return frame
@@ -73,9 +257,20 @@ class AirQualityView:
         Parameters:
         - page: The function to call to display the desired page
         """
+        if self.controller is not None:
+            self.controller.stop_playback()
         for frame in self.main_frame.winfo_children():
             frame.destroy()
+        self.date_entries = [entry for entry in self.date_entries if entry.winfo_exists()]
+        self.pm_tiles = []
+        self.heatmap_polygons = []
+        self.station_markers = []
+        self.marker_colors = None
+        self.marker = None
+        self.statistics_table = None
         page()
+        if self.controller is not None:
+            self.controller.update_forecast_tiles()
 
     def home_page(self):
         """
@@ -84,9 +279,18 @@ class AirQualityView:
         frame = CTkFrame(self.main_frame)
         select_time, self.choose_date = self.create_date_entry(frame, "Choose Date and Time:")
         hours = [f"{i:02d}:00" for i in range(1, 24)] + ["00:00"]
-        self.choose_time = CTkComboBox(select_time, state="readonly", values=hours)
+        self.choose_time = CTkComboBox(select_time, state="readonly", values=hours,
+                                       command=lambda value: self.controller.update_heatmap())
         self.choose_time.set(hours[0])
+        self.heatmap_checkbox = CTkCheckBox(select_time, text="PM2.5 Heatmap",
+                                            command=lambda: self.controller.update_heatmap(prefetch=True))
+        self.choose_date.bind("<<DateEntrySelected>>", lambda event: self.controller.update_heatmap(prefetch=True))
+        self.play_btn = CTkButton(select_time, text="Play", command=lambda: self.controller.toggle_playback())
+        self.playback_label = CTkLabel(select_time, text="")
         self.choose_time.pack(side="top", fill="x", expand=True)
+        self.heatmap_checkbox.pack(side="top", pady=5)
+        self.play_btn.pack(side="left", padx=13, pady=5)
+        self.playback_label.pack(side="left", pady=5)
         select_time.pack(side="top", fill="x", expand=True)
 
         map_frame = self.create_map_frame(frame)
@@ -123,6 +327,8 @@ class AirQualityView:
         small4.pack(side="left", fill="both", expand=True, padx=6)
         small5, color5, label5 = self.create_pm_display(small_frame, date, f"{time+5:2d}:00", "300")
         small5.pack(side="left", fill="both", expand=True, padx=6)
+        self.pm_tiles = [(color0, label0), (color1, label1), (color2, label2), (color3, label3), (color4, label4),
+                         (color5, label5)]
         small_frame.pack(side="left", fill="both")
 
         return frame
@@ -137,17 +343,7 @@ class AirQualityView:
         - time: Time for which the PM data is displayed
         - pm25: PM2.5 value to display
         """
-        pm25_int = int(pm25)
-        if pm25_int <= 25:
-            color_code = "cyan"  # Good air quality
-        elif 26 < pm25_int <= 37:
-            color_code = "lawn green"  # Moderate air quality
-        elif 38 < pm25_int <= 50:
-            color_code = "gold"  # Unhealthy for sensitive groups
-        elif 51 < pm25_int <= 90:
-            color_code = "orange"  # Unhealthy air quality
-        else:
-            color_code = "maroon"  # Very unhealthy air quality
+        color_code = self.pm25_color(pm25)
 
         frame = CTkFrame(parent, fg_color="white", border_width=4, corner_radius=40)
         color = CTkLabel(frame, text="", anchor="n", corner_radius=60, fg_color=color_code)
@@ -158,6 +354,39 @@ class AirQualityView:
         label.pack(side="top", fill="both", expand=True, padx=20, pady=15)
         return frame, color, label
 
+    @staticmethod
+    def pm25_color(pm25):
+        """
+        Get the display color for a PM2.5 value.
+
+        Parameters:
+        - pm25: PM2.5 value
+        """
+        pm25_value = float(pm25)
+        if pm25_value <= 25:
+            color_code = "cyan"  # Good air quality
+        elif pm25_value <= 37:
+            color_code = "lawn green"  # Moderate air quality
+        elif pm25_value <= 50:
+            color_code = "gold"  # Unhealthy for sensitive groups
+        elif pm25_value <= 90:
+            color_code = "orange"  # Unhealthy air quality
+        else:
+            color_code = "maroon"  # Very unhealthy air quality
+        return color_code
+
+    def update_pm_tiles(self, readings):
+        """
+        Update the PM2.5 tiles on the home page in place.
+
+        Parameters:
+        - readings: List of (time, PM2.5 value, PM2.5 category index) triples, one per tile starting with the big
+          tile; None for no value and -1 for no category
+        """
+        for (color, label), (time, pm25, category) in zip(self.pm_tiles, readings):
+            color.configure(fg_color=CATEGORY_COLORS[category])
+            label.configure(text=f"{time}    {'-' if pm25 is None else pm25}")
+
     def graph_page(self):
         """
         Display the graph page.
@@ -205,9 +434,14 @@ class AirQualityView:
                                            command=self.controller.display_distribution_graph)
         statistics_btn = CTkButton(frame, text="Descriptive Statistics", font=('bold', 15),
                                            command=self.controller.display_statistics)
+        anomalies_btn = CTkButton(frame, text="Anomalies", font=('bold', 15),
+                                  command=self.controller.display_anomalies)
         pie_chart_btn.pack(side="top", pady=10)
         distribution_graph_btn.pack(side="top")
         statistics_btn.pack(side="top", pady=10)
+        anomalies_btn.pack(side="top")
+        self.statistics_frame = CTkFrame(frame)
+        self.statistics_frame.pack(fill="x")
         self.canvas_frame2.pack(fill="both", expand=True)
         return frame
 
@@ -261,12 +495,14 @@ class AirQualityView:
         self.end_time_combobox = CTkComboBox(end_frame, state="readonly", values=hours)
         self.display_btn = CTkButton(end_frame, text="Display Graph",
                                      command=func)
+        self.export_btn = CTkButton(end_frame, text="Export", command=self.controller.export_button_clicked)
 
         start_frame.pack(side="left", fill="x", expand=True)
         end_frame.pack(side="left", fill="x", expand=True)
         self.start_time_combobox.pack(side="left", fill="x", expand=True)
         self.end_time_combobox.pack(side="left", fill="x", expand=True)
         self.display_btn.pack(side="left", padx=10)
+        self.export_btn.pack(side="left")
 
         self.start_date_entry.bind("<<DateEntrySelected>>", lambda event: self.controller.check_date())
         self.start_time_combobox.bind('<<ComboboxSelected>>', self.controller.check_time)
@@ -285,7 +521,8 @@ class AirQualityView:
         frame = CTkFrame(parent)
         start_time_label = CTkLabel(frame, text=label_text, anchor="w")
         date_entry = DateEntry(frame, width=12, background='darkblue', foreground='white', borderwidth=2,
-                               mindate=MIN_DATE, maxdate=MAX_DATE)
+                               mindate=self.min_date, maxdate=self.max_date)
+        self.date_entries.append(date_entry)
 
         start_time_label.pack(side="top", fill="x", expand=True, padx=13)
         date_entry.pack(side="left", padx=13)
@@ -302,14 +539,109 @@ class AirQualityView:
         self.map_widget = TkinterMapView(frame, width=600, height=400, corner_radius=15)
         # google normal tile server
         self.map_widget.set_tile_server("https://mt0.google.com/vt/lyrs=m&hl=en&x={x}&y={y}&z={z}&s=Ga", max_zoom=22)
-        # set the default position to be Department of Computer Engineering Building at Kasetsart University
-        self.map_widget.set_position(13.8463425, 100.5685577)
+        self.map_widget.set_position(*self.map_position)
         self.map_widget.pack(side="left", fill="both", expand=True, padx=10, pady=10)
         self.map_widget.add_right_click_menu_command(label="Add Marker",
                                                      command=self.add_marker_event,
                                                      pass_coords=True)
         return frame
 
+    def heatmap_enabled(self):
+        """
+        Check if the PM2.5 heatmap is turned on.
+        """
+        return bool(self.heatmap_checkbox.get())
+
+    def draw_heatmap(self, cells, categories):
+        """
+        Draw the PM2.5 heatmap over the map, recoloring the existing cells in place when possible.
+
+        Parameters:
+        - cells: List of cell polygons as [(lat, lon), ...]
+        - categories: PM2.5 category index of each cell's interpolated value, -1 for cells left unfilled
+        """
+        if len(self.heatmap_polygons) != len(cells):
+            self.clear_heatmap()
+            self.heatmap_polygons = [self.map_widget.set_polygon(cell, fill_color="", outline_color="", border_width=0)
+                                     for cell in cells]
+        # Same color scale as the station markers
+        colors = np.where(categories >= 0, CATEGORY_COLORS[categories], "")
+        for polygon, color in zip(self.heatmap_polygons, colors):
+            polygon.fill_color = color
+            if polygon.canvas_polygon is not None:
+                # Stippling keeps the map visible under the cells, as Tk canvases have no alpha
+                self.map_widget.canvas.itemconfig(polygon.canvas_polygon, fill=color, stipple="gray50")
+
+    def clear_heatmap(self):
+        """
+        Remove the PM2.5 heatmap from the map.
+        """
+        for polygon in self.heatmap_polygons:
+            polygon.delete()
+        self.heatmap_polygons = []
+
+    def show_station_markers(self, stations, latitudes, longitudes):
+        """
+        Place one marker per station on the map for playback, reusing the markers already placed.
+
+        Parameters:
+        - stations: Station names
+        - latitudes: Station latitudes
+        - longitudes: Station longitudes
+        """
+        # Markers deleted from the map by something else cannot be reused
+        if len(self.station_markers) == len(stations) and not any(marker.deleted for marker in self.station_markers):
+            return
+        self.clear_station_markers()
+        self.station_markers = [self.map_widget.set_marker(lat, lon, text=name)
+                                for name, lat, lon in zip(stations, latitudes, longitudes)]
+        self.marker_colors = np.full(len(stations), "", dtype=object)
+
+    def update_station_markers(self, categories, texts):
+        """
+        Recolor and relabel the station markers in place for one playback frame.
+
+        Only markers whose color or text changed are touched, so frames stay cheap.
+
+        Parameters:
+        - categories: PM2.5 category index of each station, -1 for no category
+        - texts: Marker text of each station
+        """
+        colors = CATEGORY_COLORS[categories]
+        changed = np.flatnonzero(colors != self.marker_colors)
+        for i in changed:
+            marker = self.station_markers[i]
+            marker.marker_color_circle = colors[i]
+            marker.marker_color_outside = colors[i]
+            if marker.polygon is not None:
+                self.map_widget.canvas.itemconfig(marker.polygon, fill=colors[i])
+            if marker.big_circle is not None:
+                self.map_widget.canvas.itemconfig(marker.big_circle, fill=colors[i])
+        self.marker_colors = colors
+        for marker, text in zip(self.station_markers, texts):
+            if marker.text != text:
+                marker.set_text(text)
+
+    def clear_station_markers(self):
+        """
+        Remove the playback station markers from the map.
+        """
+        for marker in self.station_markers:
+            marker.delete()
+        self.station_markers = []
+        self.marker_colors = None
+
+    def set_playback_state(self, playing, label=""):
+        """
+        Update the playback button and the label showing the frame time.
+
+        Parameters:
+        - playing: True while playback is running
+        - label: Text to show next to the button
+        """
+        self.play_btn.configure(text="Pause" if playing else "Play")
+        self.playback_label.configure(text=label)
+
     def create_searchbar(self, parent):
         """
         Create the search bar for location search.
@@ -333,11 +665,18 @@ class AirQualityView:
         - coords: Coordinates of the right-clicked point
         """
         print("Add marker:", coords)
-        self.map_widget.delete_all_marker()
+        # Only the previous right-click marker is replaced, so the playback station markers stay on the map
+        if self.marker is not None:
+            self.marker.delete()
         self.marker = self.map_widget.set_marker(coords[0], coords[1], text="marker")
         self.nearest_station = self.controller.find_nearest_station(coords[0], coords[1])
+        self.controller.update_forecast_tiles()
 
         self.pm25 = self.controller.get_pm25(self.get_choose_date(), self.get_choose_time(), self.nearest_station)
+        if self.pm25 is None:
+            messagebox.showinfo("Nearest Station", f"Nearest Station is {self.nearest_station} has no pm2.5 reading "
+                                                   f"for the selected date and time")
+            return
         messagebox.showinfo("Nearest Station", f"Nearest Station is {self.nearest_station} has pm2.5 = {self.pm25}")
         print(self.pm25)
 
@@ -386,6 +725,7 @@ class AirQualityView:
             canvas = FigureCanvasTkAgg(fig, master=self.canvas_frame1)
         canvas.draw()
         canvas.get_tk_widget().pack(fill='both', expand=True)
+        return canvas
 
     def display_graph2(self, fig):
         """
@@ -403,6 +743,35 @@ class AirQualityView:
         canvas.draw()
         canvas.get_tk_widget().pack(fill='both', expand=True)
 
+    def show_statistics_table(self, labels, columns, values):
+        """
+        Show per-station statistics in the table on the statistics tab, creating it on first use.
+
+        Parameters:
+        - labels: A (rows x 2) array of (variable, station) labels
+        - columns: Names of the statistics
+        - values: A (rows x statistics) array of values
+        """
+        if self.statistics_table is None:
+            self.statistics_table = StatisticsTable(self.statistics_frame)
+            self.statistics_table.frame.pack(fill="both", expand=True, pady=5)
+        self.statistics_table.set_data(labels, columns, values)
+
+    def show_report(self, title, text):
+        """
+        Show a long text report in a scrollable window.
+
+        Parameters:
+        - title: The window title
+        - text: The report text
+        """
+        new_window = CTkToplevel(self.root)
+        new_window.title(title)
+        textbox = CTkTextbox(new_window, width=700, height=400, font=('Courier', 13))
+        textbox.insert("0.0", text)
+        textbox.configure(state="disabled")
+        textbox.pack(fill='both', expand=True)
+
     def get_start_date(self):
         """
         Get the start date from the DateEntry widget.
@@ -457,6 +826,44 @@ class AirQualityView:
         """
         return self.choose_time.get()
 
+    def set_datasets(self, names, current):
+        """
+        Fill the dataset selector and show the current dataset in the window title.
+
+        Parameters:
+        - names: Names of the datasets in the catalog
+        - current: Name of the dataset shown
+        """
+        self.dataset_combobox.configure(values=names)
+        self.dataset_combobox.set(current)
+        self.root.title(f"{current} Air Quality Station Analysis Tool")
+
+    def set_map_position(self, latitude, longitude):
+        """
+        Set the position the map opens at and move the map there if it is shown.
+
+        Parameters:
+        - latitude: Latitude in decimal degrees
+        - longitude: Longitude in decimal degrees
+        """
+        self.map_position = (latitude, longitude)
+        if hasattr(self, "map_widget") and self.map_widget.winfo_exists():
+            self.map_widget.set_position(latitude, longitude)
+
+    def set_date_bounds(self, min_date, max_date):
+        """
+        Set the selectable date range of every DateEntry widget.
+
+        Parameters:
+        - min_date: The first selectable date
+        - max_date: The last selectable date
+        """
+        self.min_date = min_date
+        self.max_date = max_date
+        for entry in self.date_entries:
+            if entry.winfo_exists():
+                entry.configure(mindate=min_date, maxdate=max_date)
+
     def set_end_date(self, date):
         """
         Set the end date in the DateEntry widget.